@@ -0,0 +1,168 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+from .resilience import remaining_time
+from .metrics import (
+    LLM_IN_FLIGHT,
+    LLM_QUEUE_DEPTH,
+    LLM_QUEUE_WAIT,
+    LLM_CALL_LATENCY,
+    LLM_ADMISSION_REJECTIONS
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+class AdmissionRejectedError(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Review capacity exhausted ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        weights: Dict[str, int],
+        reserved: Optional[Dict[str, int]] = None,
+        ewma_alpha: float = 0.2
+    ):
+        reserved = reserved or {}
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.weights = weights
+        self.ewma_alpha = ewma_alpha
+        # Slots reserved for one lane are off limits to every other lane.
+        self.limits = {
+            lane: max(1, max_concurrency - sum(slots for other, slots in reserved.items() if other != lane))
+            for lane in weights
+        }
+        self.active = 0
+        self.lane_active = {lane: 0 for lane in weights}
+        self.service_time: Optional[float] = None
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in weights}
+        self._credit = {lane: 0 for lane in weights}
+    
+    def _lane(self, lane: str) -> str:
+        if lane not in self.weights:
+            raise ValueError(f"Unknown admission lane: {lane}")
+        return lane
+    
+    def _can_start(self, lane: str) -> bool:
+        return self.active < self.max_concurrency and self.lane_active[lane] < self.limits[lane]
+    
+    def queued(self, lane: Optional[str] = None) -> int:
+        if lane is not None:
+            return len(self._waiters[lane])
+        return sum(len(waiters) for waiters in self._waiters.values())
+    
+    def expected_wait(self, lane: str) -> float:
+        if self._can_start(lane) and not self._waiters[lane]:
+            return 0.0
+        # Handoffs ahead of a new arrival: its own lane's queue plus the
+        # share other lanes win while that queue drains.
+        own = len(self._waiters[lane]) + 1
+        ahead = own + sum(
+            min(len(waiters), own * self.weights[other] / self.weights[lane])
+            for other, waiters in self._waiters.items()
+            if other != lane
+        )
+        return ahead / self.limits[lane] * (self.service_time or 0.0)
+    
+    def _observe(self, duration: float) -> None:
+        if self.service_time is None:
+            self.service_time = duration
+        else:
+            self.service_time += self.ewma_alpha * (duration - self.service_time)
+    
+    def _set_gauges(self, lane: str) -> None:
+        LLM_QUEUE_DEPTH.labels(lane=lane).set(len(self._waiters[lane]))
+        LLM_IN_FLIGHT.labels(lane=lane).set(self.lane_active[lane])
+    
+    def _reject(self, lane: str, reason: str, retry_after: float) -> AdmissionRejectedError:
+        LLM_ADMISSION_REJECTIONS.labels(lane=lane, reason=reason).inc()
+        logger.warning(f"Rejecting {lane} LLM call ({reason}): {self.queued()} queued, {self.active} in flight")
+        return AdmissionRejectedError(reason, max(retry_after, 1.0))
+    
+    async def _acquire(self, lane: str, deadline: Optional[float]) -> None:
+        if self._can_start(lane) and not self._waiters[lane]:
+            self.active += 1
+            self.lane_active[lane] += 1
+            return
+        
+        expected = self.expected_wait(lane)
+        if len(self._waiters[lane]) >= self.max_queue:
+            raise self._reject(lane, "queue_full", expected)
+        remaining = remaining_time(deadline)
+        if remaining is not None and expected >= remaining:
+            raise self._reject(lane, "deadline", expected)
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(waiter)
+        self._set_gauges(lane)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=remaining)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done():
+                # The slot was handed over just as we gave up; pass it on.
+                self._release(lane)
+            else:
+                waiter.cancel()
+                self._waiters[lane].remove(waiter)
+                self._set_gauges(lane)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject(lane, "deadline", self.expected_wait(lane))
+            raise
+    
+    def _next_lane(self) -> Optional[str]:
+        # Smooth weighted round robin over lanes that have waiters and
+        # room under their limit.
+        eligible = [
+            lane for lane, waiters in self._waiters.items()
+            if waiters and self.lane_active[lane] < self.limits[lane]
+        ]
+        if not eligible:
+            return None
+        for lane in eligible:
+            self._credit[lane] += self.weights[lane]
+        chosen = max(eligible, key=lambda lane: self._credit[lane])
+        self._credit[chosen] -= sum(self.weights[lane] for lane in eligible)
+        return chosen
+    
+    def _release(self, lane: str) -> None:
+        self.lane_active[lane] -= 1
+        self._set_gauges(lane)
+        
+        next_lane = self._next_lane()
+        if next_lane is None:
+            self.active -= 1
+            return
+        
+        # The freed slot moves straight to the chosen waiter.
+        waiter = self._waiters[next_lane].popleft()
+        self.lane_active[next_lane] += 1
+        self._set_gauges(next_lane)
+        waiter.set_result(None)
+    
+    @asynccontextmanager
+    async def slot(self, lane: str = INTERACTIVE, deadline: Optional[float] = None) -> AsyncIterator[None]:
+        lane = self._lane(lane)
+        queued_at = time.monotonic()
+        await self._acquire(lane, deadline)
+        started_at = time.monotonic()
+        LLM_QUEUE_WAIT.labels(lane=lane).observe(started_at - queued_at)
+        self._set_gauges(lane)
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - started_at
+            LLM_CALL_LATENCY.labels(lane=lane).observe(duration)
+            self._observe(duration)
+            self._release(lane)
@@ -0,0 +1,83 @@
+import json
+import zlib
+import msgpack
+from typing import Any, Dict, Tuple
+from .metrics import CACHE_ENTRY_BYTES, CACHE_COMPRESSION_RATIO
+
+# Every encoded entry starts with one header byte: the high nibble names the
+# serializer and the low nibble the compression. Entries written before the
+# codec existed are plain JSON objects or arrays and start with "{" or "[",
+# which never collides with a header.
+SERIALIZERS = {"json": 0x1, "msgpack": 0x2}
+COMPRESSIONS = {"none": 0x0, "zlib": 0x1, "zstd": 0x2}
+LEGACY_JSON_PREFIXES = (ord("{"), ord("["))
+
+def _zstd():
+    import zstandard
+    return zstandard
+
+class CacheCodec:
+    def __init__(self, serializer: str = "msgpack", compression: str = "zlib", threshold: int = 1024):
+        if serializer not in SERIALIZERS:
+            raise ValueError(f"Unknown cache serializer: {serializer}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown cache compression: {compression}")
+        if compression == "zstd":
+            _zstd()
+        
+        self.serializer = serializer
+        self.compression = compression
+        self.threshold = threshold
+        self._totals: Dict[str, Tuple[int, int]] = {}
+    
+    def _serialize(self, value: Any) -> bytes:
+        if self.serializer == "msgpack":
+            return msgpack.packb(value, use_bin_type=True)
+        return json.dumps(value, separators=(",", ":")).encode()
+    
+    def _compress(self, data: bytes) -> Tuple[str, bytes]:
+        if self.compression == "none" or len(data) < self.threshold:
+            return "none", data
+        if self.compression == "zstd":
+            return "zstd", _zstd().ZstdCompressor().compress(data)
+        return "zlib", zlib.compress(data, 6)
+    
+    def encode(self, value: Any, keyspace: str = "default") -> bytes:
+        serialized = self._serialize(value)
+        compression, payload = self._compress(serialized)
+        header = (SERIALIZERS[self.serializer] << 4) | COMPRESSIONS[compression]
+        encoded = bytes([header]) + payload
+        self._record(keyspace, len(serialized), len(encoded))
+        return encoded
+    
+    def decode(self, data: Any) -> Any:
+        if isinstance(data, str):
+            data = data.encode()
+        if not data:
+            return None
+        if data[0] in LEGACY_JSON_PREFIXES:
+            return json.loads(data)
+        
+        serializer, compression = data[0] >> 4, data[0] & 0x0F
+        payload = data[1:]
+        if compression == COMPRESSIONS["zlib"]:
+            payload = zlib.decompress(payload)
+        elif compression == COMPRESSIONS["zstd"]:
+            payload = _zstd().ZstdDecompressor().decompress(payload)
+        elif compression != COMPRESSIONS["none"]:
+            raise ValueError(f"Unknown cache compression header: {data[0]:#04x}")
+        
+        if serializer == SERIALIZERS["msgpack"]:
+            return msgpack.unpackb(payload, raw=False)
+        if serializer == SERIALIZERS["json"]:
+            return json.loads(payload)
+        raise ValueError(f"Unknown cache serializer header: {data[0]:#04x}")
+    
+    def _record(self, keyspace: str, raw_size: int, stored_size: int) -> None:
+        raw_total, stored_total = self._totals.get(keyspace, (0, 0))
+        raw_total += raw_size
+        stored_total += stored_size
+        self._totals[keyspace] = (raw_total, stored_total)
+        
+        CACHE_ENTRY_BYTES.labels(keyspace=keyspace).observe(stored_size)
+        CACHE_COMPRESSION_RATIO.labels(keyspace=keyspace).set(raw_total / stored_total)
@@ -1,96 +1,497 @@
-import json
-import redis
-from typing import Optional, Dict, Any
+import os
+import asyncio
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Tuple
+from redis.exceptions import ResponseError
 import logging
 from .config import settings
-from .models import CodeReviewResponse, FeedbackRequest
+from .models import CodeReviewResponse, FeedbackRequest, LLMReviewResult
+from .redis_pool import RedisPool
+from .local_cache import LocalCache
+from .cache_codec import CacheCodec
+from .metrics import (
+    L1_CACHE_HITS,
+    L1_CACHE_MISSES,
+    L2_CACHE_HITS,
+    L2_CACHE_MISSES,
+    L1_CACHE_ENTRIES,
+    L1_CACHE_BYTES,
+    CACHE_INVALIDATIONS,
+    CACHE_FINGERPRINT_HITS
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
 class CacheManager:
-    def __init__(self):
-        self.redis_client = redis.Redis(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            password=settings.REDIS_PASSWORD or None,
-            decode_responses=True
-        )
+    def __init__(self, redis_pool: RedisPool):
+        self.redis_pool = redis_pool
+        self.redis_client = redis_pool.client
         self.ttl = settings.CACHE_TTL
+        self.local_cache = LocalCache(
+            max_entries=settings.L1_CACHE_MAX_ENTRIES,
+            max_bytes=settings.L1_CACHE_MAX_BYTES,
+            ttl=min(settings.L1_CACHE_TTL, settings.CACHE_TTL)
+        )
+        self.codec = CacheCodec(
+            serializer=settings.CACHE_SERIALIZER,
+            compression=settings.CACHE_COMPRESSION,
+            threshold=settings.CACHE_COMPRESSION_THRESHOLD
+        )
+    
+    def _response_size(self, response: CodeReviewResponse) -> int:
+        # Rough in-memory footprint used for the L1 byte limit.
+        size = len(response.review) + 256
+        size += sum(len(b.description) + len(b.suggestion or "") + 64 for b in response.bugs_detected)
+        size += sum(len(s.description) + len(s.code_snippet or "") + 64 for s in response.suggestions)
+        return size
+    
+    def _store_local(self, key: str, response: CodeReviewResponse, source: Optional[str]) -> None:
+        self.local_cache.set(key, (response, source), self._response_size(response))
+        L1_CACHE_ENTRIES.set(len(self.local_cache))
+        L1_CACHE_BYTES.set(self.local_cache.size_bytes)
+    
+    def _evict_local(self, key: Optional[str]) -> None:
+        if key is None:
+            self.local_cache.clear()
+        else:
+            self.local_cache.delete(key)
+        L1_CACHE_ENTRIES.set(len(self.local_cache))
+        L1_CACHE_BYTES.set(self.local_cache.size_bytes)
+    
+    def _record_fingerprint_hit(self, cached_source: Optional[str], source: Optional[str]) -> None:
+        # A hit whose stored source differs from the submitted code is one
+        # that only the normalized fingerprint made possible.
+        if source:
+            match = "exact" if cached_source == source else "normalized"
+            CACHE_FINGERPRINT_HITS.labels(match=match).inc()
+    
+    async def cache_review(
+        self,
+        key: str,
+        response: CodeReviewResponse,
+        source: Optional[str] = None,
+        meta: Optional[Dict[str, str]] = None
+    ) -> bool:
+        self._store_local(key, response, source)
         
-        try:
-            self.redis_client.ping()
-            logger.info("Successfully connected to Redis")
-        except redis.ConnectionError:
-            logger.warning("Could not connect to Redis - caching will be disabled")
-            self.redis_client = None
-    
-    async def cache_review(self, key: str, response: CodeReviewResponse) -> bool:
-        if not self.redis_client:
+        if not self.redis_pool.available:
             return False
             
         try:
-            response_json = json.dumps(response.model_dump())
-            result = self.redis_client.setex(f"review:{key}", self.ttl, response_json)
+            payload = response.model_dump()
+            payload["source_digest"] = source
+            encoded = self.codec.encode(payload, keyspace="review")
+            
+            pipeline = self.redis_client.pipeline(transaction=False)
+            pipeline.setex(f"review:{key}", self.ttl, encoded)
+            if meta:
+                # Lets the feedback aggregator attribute feedback, which only
+                # carries the request id, to a language, model and prompt.
+                pipeline.setex(
+                    f"review-meta:{response.request_id}",
+                    settings.REVIEW_META_TTL,
+                    self.codec.encode(meta, keyspace="review-meta")
+                )
+            result = (await pipeline.execute())[0]
             return result
         except Exception as e:
+            self.redis_pool.record_failure(e)
             logger.error(f"Error caching review: {e}")
             return False
     
-    async def get_cached_review(self, key: str) -> Optional[CodeReviewResponse]:
-        if not self.redis_client:
+    async def get_cached_review(self, key: str, source: Optional[str] = None) -> Optional[CodeReviewResponse]:
+        local = self.local_cache.get(key)
+        if local is not None:
+            L1_CACHE_HITS.inc()
+            response, cached_source = local
+            self._record_fingerprint_hit(cached_source, source)
+            return response
+        L1_CACHE_MISSES.inc()
+        
+        if not self.redis_pool.available:
             return None
             
         try:
-            cached = self.redis_client.get(f"review:{key}")
+            cached = await self.redis_client.get(f"review:{key}")
             if cached:
-                response_dict = json.loads(cached)
-                return CodeReviewResponse(**response_dict)
+                L2_CACHE_HITS.inc()
+                response_dict = self.codec.decode(cached)
+                response = CodeReviewResponse(**response_dict)
+                cached_source = response_dict.get("source_digest")
+                self._store_local(key, response, cached_source)
+                self._record_fingerprint_hit(cached_source, source)
+                return response
+            L2_CACHE_MISSES.inc()
             return None
         except Exception as e:
+            self.redis_pool.record_failure(e)
             logger.error(f"Error retrieving cached review: {e}")
             return None
     
+    async def get_cached_reviews(self, lookups: List[Tuple[str, Optional[str]]]) -> Dict[str, CodeReviewResponse]:
+        # Batch counterpart of get_cached_review: L1 first, then a single
+        # MGET for every key L1 could not serve.
+        found = {}
+        remote = {}
+        for key, source in lookups:
+            local = self.local_cache.get(key)
+            if local is not None:
+                L1_CACHE_HITS.inc()
+                found[key] = local[0]
+                self._record_fingerprint_hit(local[1], source)
+            else:
+                L1_CACHE_MISSES.inc()
+                remote[key] = source
+        
+        if not remote or not self.redis_pool.available:
+            return found
+            
+        try:
+            keys = list(remote)
+            cached = await self.redis_client.mget([f"review:{key}" for key in keys])
+        except Exception as e:
+            self.redis_pool.record_failure(e)
+            logger.error(f"Error retrieving cached reviews: {e}")
+            return found
+        
+        for key, value in zip(keys, cached):
+            if not value:
+                L2_CACHE_MISSES.inc()
+                continue
+            try:
+                response_dict = self.codec.decode(value)
+                response = CodeReviewResponse(**response_dict)
+            except Exception as e:
+                # One unreadable entry is a miss, not a failed batch.
+                L2_CACHE_MISSES.inc()
+                logger.error(f"Error decoding cached review {key}: {e}")
+                continue
+            L2_CACHE_HITS.inc()
+            found[key] = response
+            self._store_local(key, response, response_dict.get("source_digest"))
+            self._record_fingerprint_hit(response_dict.get("source_digest"), remote[key])
+        return found
+    
+    async def get_unit_reviews(self, keys: List[str]) -> Dict[str, LLMReviewResult]:
+        if not keys or not self.redis_pool.available:
+            return {}
+            
+        try:
+            cached = await self.redis_client.mget([f"unit-review:{key}" for key in keys])
+            return {
+                key: LLMReviewResult(**self.codec.decode(value))
+                for key, value in zip(keys, cached)
+                if value
+            }
+        except Exception as e:
+            self.redis_pool.record_failure(e)
+            logger.error(f"Error retrieving cached unit reviews: {e}")
+            return {}
+    
+    async def cache_unit_reviews(self, reviews: Dict[str, LLMReviewResult]) -> bool:
+        if not reviews or not self.redis_pool.available:
+            return False
+            
+        try:
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for key, review in reviews.items():
+                pipeline.setex(
+                    f"unit-review:{key}",
+                    self.ttl,
+                    self.codec.encode(review.model_dump(), keyspace="unit-review")
+                )
+            await pipeline.execute()
+            return True
+        except Exception as e:
+            self.redis_pool.record_failure(e)
+            logger.error(f"Error caching unit reviews: {e}")
+            return False
+    
+    async def acquire_review_lock(self, key: str) -> Optional[str]:
+        # Returns a token when this replica should compute the review, or
+        # None when another replica already holds the lock for it. Without
+        # Redis every replica computes on its own.
+        token = uuid.uuid4().hex
+        if not self.redis_pool.available:
+            return token
+            
+        try:
+            acquired = await self.redis_client.set(
+                f"lock:review:{key}", token, nx=True, ex=settings.SINGLE_FLIGHT_LOCK_TTL
+            )
+            return token if acquired else None
+        except Exception as e:
+            self.redis_pool.record_failure(e)
+            logger.error(f"Error acquiring review lock: {e}")
+            return token
+    
+    async def release_review_lock(self, key: str, token: str) -> bool:
+        if not self.redis_pool.available:
+            return False
+            
+        try:
+            return bool(await self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:review:{key}", token))
+        except Exception as e:
+            self.redis_pool.record_failure(e)
+            logger.error(f"Error releasing review lock: {e}")
+            return False
+    
+    async def wait_for_review(self, key: str, timeout: float) -> Optional[CodeReviewResponse]:
+        # The lock holder hands its result off through the regular review
+        # entry, so waiters poll it until it appears or the lock goes away.
+        deadline = time.monotonic() + timeout
+        interval = 0.05
+        
+        while time.monotonic() < deadline and self.redis_pool.available:
+            try:
+                pipeline = self.redis_client.pipeline(transaction=False)
+                pipeline.get(f"review:{key}")
+                pipeline.exists(f"lock:review:{key}")
+                cached, locked = await pipeline.execute()
+            except Exception as e:
+                self.redis_pool.record_failure(e)
+                logger.error(f"Error waiting for in-flight review: {e}")
+                return None
+            
+            if cached:
+                response_dict = self.codec.decode(cached)
+                response = CodeReviewResponse(**response_dict)
+                self._store_local(key, response, response_dict.get("source_digest"))
+                return response
+            if not locked:
+                return None
+            
+            await asyncio.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+            interval = min(interval * 1.5, 0.5)
+        
+        return None
+    
+    async def invalidate_review(self, key: Optional[str] = None) -> bool:
+        # key=None drops every L1 entry on every replica; Redis entries are
+        # only deleted for an explicit key.
+        self._evict_local(key)
+        CACHE_INVALIDATIONS.labels(source="local").inc()
+        
+        if not self.redis_pool.available:
+            return False
+            
+        try:
+            pipeline = self.redis_client.pipeline(transaction=False)
+            if key is not None:
+                pipeline.delete(f"review:{key}")
+            pipeline.publish(settings.CACHE_INVALIDATION_CHANNEL, key if key is not None else "*")
+            await pipeline.execute()
+            return True
+        except Exception as e:
+            self.redis_pool.record_failure(e)
+            logger.error(f"Error invalidating cached review: {e}")
+            return False
+    
+    async def listen_for_invalidations(self) -> None:
+        while True:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(settings.CACHE_INVALIDATION_CHANNEL)
+                # Anything cached locally may be stale after a disconnect,
+                # since invalidations published meanwhile were missed.
+                self._evict_local(None)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    data = message["data"].decode()
+                    self._evict_local(None if data == "*" else data)
+                    CACHE_INVALIDATIONS.labels(source="remote").inc()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.redis_pool.record_failure(e)
+                logger.warning(f"Cache invalidation listener disconnected: {e}")
+                await asyncio.sleep(settings.REDIS_RECONNECT_BACKOFF)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+    
     async def store_feedback(self, feedback: FeedbackRequest) -> bool:
-        if not self.redis_client:
+        if not self.redis_pool.available:
             return False
             
         try:
             feedback_key = f"feedback:{feedback.request_id}"
-            feedback_json = json.dumps(feedback.model_dump())
-            result = self.redis_client.set(feedback_key, feedback_json)
+            feedback_data = self.codec.encode(feedback.model_dump(), keyspace="feedback")
             
-            self.redis_client.lpush("all_feedback", feedback_json)
+            pipeline = self.redis_client.pipeline(transaction=False)
+            pipeline.set(feedback_key, feedback_data)
+            pipeline.xadd(
+                settings.FEEDBACK_STREAM,
+                {
+                    "request_id": feedback.request_id,
+                    "helpful": "1" if feedback.helpful else "0",
+                    "user_id": feedback.user_id or "anonymous"
+                },
+                maxlen=settings.FEEDBACK_STREAM_MAXLEN,
+                approximate=True
+            )
+            result, _ = await pipeline.execute()
             return result
         except Exception as e:
+            self.redis_pool.record_failure(e)
             logger.error(f"Error storing feedback: {e}")
             return False
     
+    async def _aggregate_feedback(self, entries: list) -> None:
+        request_ids = [fields[b"request_id"].decode() for _, fields in entries]
+        metas = await self.redis_client.mget([f"review-meta:{request_id}" for request_id in request_ids])
+        
+        pipeline = self.redis_client.pipeline(transaction=True)
+        for (entry_id, fields), meta in zip(entries, metas):
+            meta = self.codec.decode(meta) if meta else {}
+            helpful = fields[b"helpful"] == b"1"
+            day = datetime.fromtimestamp(int(entry_id.split(b"-")[0]) / 1000, timezone.utc)
+            stats_key = f"feedback:stats:{day:%Y%m%d}"
+            
+            for dimension in ("all", "language", "model", "prompt_version"):
+                value = "all" if dimension == "all" else meta.get(dimension, "unknown")
+                pipeline.hincrby(stats_key, f"{dimension}|{value}|total", 1)
+                if helpful:
+                    pipeline.hincrby(stats_key, f"{dimension}|{value}|helpful", 1)
+            pipeline.expire(stats_key, (settings.FEEDBACK_STATS_RETENTION_DAYS + 1) * 86400)
+        
+        pipeline.xack(settings.FEEDBACK_STREAM, settings.FEEDBACK_CONSUMER_GROUP, *[entry_id for entry_id, _ in entries])
+        await pipeline.execute()
+    
+    async def _claim_stale_feedback(self, consumer: str) -> None:
+        # Entries read by a consumer that died before acknowledging them are
+        # taken over once they have sat idle long enough.
+        start_id = "0-0"
+        while True:
+            response = await self.redis_client.xautoclaim(
+                settings.FEEDBACK_STREAM,
+                settings.FEEDBACK_CONSUMER_GROUP,
+                consumer,
+                min_idle_time=int(settings.FEEDBACK_CLAIM_IDLE_SECONDS * 1000),
+                start_id=start_id,
+                count=100
+            )
+            start_id, claimed = response[0], response[1]
+            entries = [(entry_id, fields) for entry_id, fields in claimed if fields]
+            if entries:
+                logger.info(f"Claimed {len(entries)} stale feedback entries")
+                await self._aggregate_feedback(entries)
+            if start_id in (b"0-0", "0-0"):
+                return
+    
+    async def consume_feedback(self) -> None:
+        consumer = f"{socket.gethostname()}-{os.getpid()}"
+        # Start with entries this consumer read but never acknowledged, then
+        # switch to new ones.
+        last_id = "0"
+        next_claim = 0.0
+        
+        while True:
+            try:
+                try:
+                    await self.redis_client.xgroup_create(
+                        settings.FEEDBACK_STREAM, settings.FEEDBACK_CONSUMER_GROUP, id="0", mkstream=True
+                    )
+                except ResponseError as e:
+                    if "BUSYGROUP" not in str(e):
+                        raise
+                
+                while True:
+                    if time.monotonic() >= next_claim:
+                        await self._claim_stale_feedback(consumer)
+                        next_claim = time.monotonic() + settings.FEEDBACK_CLAIM_INTERVAL
+                    
+                    response = await self.redis_client.xreadgroup(
+                        settings.FEEDBACK_CONSUMER_GROUP,
+                        consumer,
+                        {settings.FEEDBACK_STREAM: last_id},
+                        count=100,
+                        block=1000
+                    )
+                    entries = response[0][1] if response else []
+                    if entries:
+                        await self._aggregate_feedback(entries)
+                    elif last_id == "0":
+                        last_id = ">"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.redis_pool.record_failure(e)
+                logger.warning(f"Feedback consumer error: {e}")
+                # Whatever was read before the failure is still pending for
+                # this consumer and is re-read from the start.
+                last_id = "0"
+                await asyncio.sleep(settings.REDIS_RECONNECT_BACKOFF)
+    
+    async def get_feedback_stats(self, days: int) -> Optional[Dict[str, Dict[str, Dict[str, int]]]]:
+        if not self.redis_pool.available:
+            return None
+            
+        try:
+            today = datetime.now(timezone.utc)
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for offset in range(days):
+                pipeline.hgetall(f"feedback:stats:{today - timedelta(days=offset):%Y%m%d}")
+            daily = await pipeline.execute()
+        except Exception as e:
+            self.redis_pool.record_failure(e)
+            logger.error(f"Error retrieving feedback stats: {e}")
+            return None
+        
+        stats: Dict[str, Dict[str, Dict[str, int]]] = {}
+        for bucket in daily:
+            for field, count in bucket.items():
+                dimension, rest = field.decode().split("|", 1)
+                value, counter = rest.rsplit("|", 1)
+                counters = stats.setdefault(dimension, {}).setdefault(value, {"total": 0, "helpful": 0})
+                counters[counter] += int(count)
+        return stats
+    
     async def get_conversation_history(self, user_id: str) -> list:
-        if not self.redis_client:
+        if not self.redis_pool.available:
             return []
             
         try:
             history_key = f"history:{user_id}"
-            history = self.redis_client.lrange(history_key, 0, 9)
-            return [json.loads(item) for item in history]
+            pipeline = self.redis_client.pipeline(transaction=False)
+            pipeline.lrange(history_key, 0, settings.HISTORY_LOAD_TURNS - 1)
+            pipeline.expire(history_key, settings.HISTORY_TTL)
+            history, _ = await pipeline.execute()
+            return [self.codec.decode(item) for item in history]
         except Exception as e:
+            self.redis_pool.record_failure(e)
             logger.error(f"Error retrieving conversation history: {e}")
             return []
     
     async def add_to_conversation_history(self, user_id: str, data: Dict[str, Any]) -> bool:
-        if not self.redis_client:
+        if not self.redis_pool.available:
             return False
             
         try:
             history_key = f"history:{user_id}"
-            history_item = json.dumps(data)
-            
-            self.redis_client.lpush(history_key, history_item)
-            self.redis_client.ltrim(history_key, 0, 19)
+            history_item = self.codec.encode(data, keyspace="history")
             
-            self.redis_client.expire(history_key, 60 * 60 * 24 * 7)
+            pipeline = self.redis_client.pipeline(transaction=True)
+            pipeline.lpush(history_key, history_item)
+            pipeline.ltrim(history_key, 0, settings.HISTORY_MAX_TURNS - 1)
+            pipeline.expire(history_key, settings.HISTORY_TTL)
+            await pipeline.execute()
             return True
         except Exception as e:
+            self.redis_pool.record_failure(e)
             logger.error(f"Error adding to conversation history: {e}")
             return False
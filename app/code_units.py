@@ -0,0 +1,131 @@
+import ast
+from typing import List, NamedTuple
+from .tokens import estimate_tokens
+
+class CodeUnit(NamedTuple):
+    start_line: int
+    end_line: int
+    source: str
+
+class CodeChunk(NamedTuple):
+    start_line: int
+    end_line: int
+    source: str
+    overlap: int
+
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+def _python_boundaries(code: str, lines: List[str]) -> List[int]:
+    tree = ast.parse(code)
+    boundaries = []
+    previous_was_definition = True
+    
+    for node in tree.body:
+        is_definition = isinstance(node, _DEFINITIONS)
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        while start > 1 and lines[start - 2].lstrip().startswith("#"):
+            start -= 1
+        # Consecutive module-level statements (imports, constants, ...) are
+        # kept together as one unit; every def/class starts its own.
+        if is_definition or previous_was_definition:
+            boundaries.append(start)
+        previous_was_definition = is_definition
+    
+    return boundaries
+
+def _heuristic_boundaries(lines: List[str]) -> List[int]:
+    boundaries = [1]
+    depth = 0
+    previous_blank = False
+    
+    for number, line in enumerate(lines, start=1):
+        stripped = line.strip()
+        if (
+            stripped
+            and depth == 0
+            and previous_blank
+            and not line[0].isspace()
+            and not stripped.startswith(("}", ")", "]"))
+        ):
+            boundaries.append(number)
+        depth = max(depth + line.count("{") + line.count("(") - line.count("}") - line.count(")"), 0)
+        previous_blank = not stripped
+    
+    return boundaries
+
+def split_units(code: str, language: str) -> List[CodeUnit]:
+    lines = code.splitlines()
+    if not lines:
+        return []
+    
+    boundaries = None
+    if language.strip().lower() == "python":
+        try:
+            boundaries = _python_boundaries(code, lines)
+        except SyntaxError:
+            pass
+    if not boundaries:
+        boundaries = _heuristic_boundaries(lines)
+    
+    # Lines between units are attached to a neighbouring unit, so the units
+    # always cover the whole submission.
+    boundaries = sorted(set(boundaries) - {1})
+    starts = [1] + boundaries
+    ends = [b - 1 for b in boundaries] + [len(lines)]
+    
+    return [
+        CodeUnit(start, end, "\n".join(lines[start - 1:end]))
+        for start, end in zip(starts, ends)
+    ]
+
+def _split_lines(unit: CodeUnit, max_tokens: int) -> List[CodeUnit]:
+    pieces = []
+    start = unit.start_line
+    buffer: List[str] = []
+    size = 0
+    
+    for line in unit.source.split("\n"):
+        line_tokens = estimate_tokens(line + "\n")
+        if buffer and size + line_tokens > max_tokens:
+            pieces.append(CodeUnit(start, start + len(buffer) - 1, "\n".join(buffer)))
+            start += len(buffer)
+            buffer, size = [], 0
+        buffer.append(line)
+        size += line_tokens
+    
+    if buffer:
+        pieces.append(CodeUnit(start, start + len(buffer) - 1, "\n".join(buffer)))
+    return pieces
+
+def split_chunks(code: str, language: str, max_tokens: int, overlap_lines: int) -> List[CodeChunk]:
+    lines = code.splitlines()
+    
+    # Whole units are packed together up to the budget; only a unit that is
+    # too large on its own is cut between lines.
+    pieces: List[CodeUnit] = []
+    for unit in split_units(code, language):
+        if estimate_tokens(unit.source) > max_tokens:
+            pieces.extend(_split_lines(unit, max_tokens))
+        else:
+            pieces.append(unit)
+    
+    spans = []
+    start, size = None, 0
+    for piece in pieces:
+        piece_tokens = estimate_tokens(piece.source + "\n")
+        if start is not None and size + piece_tokens > max_tokens:
+            spans.append((start, piece.start_line - 1))
+            start, size = None, 0
+        if start is None:
+            start = piece.start_line
+        size += piece_tokens
+    if start is not None:
+        spans.append((start, len(lines)))
+    
+    chunks = []
+    for index, (start, end) in enumerate(spans):
+        # Later chunks repeat the tail of the previous one so that code
+        # straddling a boundary is seen with its lead-in.
+        overlap = min(overlap_lines, start - 1) if index else 0
+        chunks.append(CodeChunk(start - overlap, end, "\n".join(lines[start - overlap - 1:end]), overlap))
+    return chunks
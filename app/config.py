@@ -9,18 +9,105 @@ class Settings(BaseSettings):
     API_VERSION: str = "1.0.0"
     
     GEMINI_API_KEY: str = os.environ.get("GEMINI_API_KEY", "")
+    GEMINI_MODEL: str = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+    GEMINI_LIGHT_MODEL: str = os.environ.get("GEMINI_LIGHT_MODEL", "gemini-2.0-flash-lite")
+    GEMINI_STRONG_MODEL: str = os.environ.get("GEMINI_STRONG_MODEL", "gemini-2.5-pro")
+    MODEL_LIGHT_MAX_TOKENS: int = int(os.environ.get("MODEL_LIGHT_MAX_TOKENS", 400))
+    MODEL_STRONG_MIN_TOKENS: int = int(os.environ.get("MODEL_STRONG_MIN_TOKENS", 4000))
+    MODEL_LIGHT_LANGUAGES: str = os.environ.get("MODEL_LIGHT_LANGUAGES", "python,javascript,typescript,java,go")
+    MODEL_ESCALATION: bool = os.environ.get("MODEL_ESCALATION", "true").lower() == "true"
+    
+    LLM_BACKEND: str = os.environ.get("LLM_BACKEND", "gemini")
+    FAKE_LLM_LATENCY_MS: float = float(os.environ.get("FAKE_LLM_LATENCY_MS", 800.0))
+    FAKE_LLM_LATENCY_SIGMA: float = float(os.environ.get("FAKE_LLM_LATENCY_SIGMA", 0.5))
+    FAKE_LLM_TOKENS_PER_SECOND: float = float(os.environ.get("FAKE_LLM_TOKENS_PER_SECOND", 150.0))
+    FAKE_LLM_OUTPUT_TOKENS: int = int(os.environ.get("FAKE_LLM_OUTPUT_TOKENS", 600))
+    FAKE_LLM_ERROR_RATE: float = float(os.environ.get("FAKE_LLM_ERROR_RATE", 0.0))
+    
+    REVIEW_DEADLINE_SECONDS: float = float(os.environ.get("REVIEW_DEADLINE_SECONDS", 55.0))
+    LLM_MAX_ATTEMPTS: int = int(os.environ.get("LLM_MAX_ATTEMPTS", 3))
+    LLM_RETRY_BASE_DELAY: float = float(os.environ.get("LLM_RETRY_BASE_DELAY", 0.5))
+    LLM_RETRY_MAX_DELAY: float = float(os.environ.get("LLM_RETRY_MAX_DELAY", 8.0))
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = int(os.environ.get("LLM_CIRCUIT_FAILURE_THRESHOLD", 5))
+    LLM_CIRCUIT_RECOVERY_SECONDS: float = float(os.environ.get("LLM_CIRCUIT_RECOVERY_SECONDS", 30.0))
+    LLM_MAX_CONCURRENCY: int = int(os.environ.get("LLM_MAX_CONCURRENCY", 8))
+    LLM_MAX_QUEUE: int = int(os.environ.get("LLM_MAX_QUEUE", 100))
+    LLM_INTERACTIVE_WEIGHT: int = int(os.environ.get("LLM_INTERACTIVE_WEIGHT", 4))
+    LLM_BULK_WEIGHT: int = int(os.environ.get("LLM_BULK_WEIGHT", 1))
+    LLM_INTERACTIVE_RESERVED: int = int(os.environ.get("LLM_INTERACTIVE_RESERVED", 2))
+    
+    STARTUP_CHECK_TIMEOUT: float = float(os.environ.get("STARTUP_CHECK_TIMEOUT", 3.0))
     
     REDIS_HOST: str = os.environ.get("REDIS_HOST", "redis")
     REDIS_PORT: int = int(os.environ.get("REDIS_PORT", 6379))
     REDIS_PASSWORD: str = os.environ.get("REDIS_PASSWORD", "")
+    REDIS_MAX_CONNECTIONS: int = int(os.environ.get("REDIS_MAX_CONNECTIONS", 50))
+    REDIS_SOCKET_TIMEOUT: float = float(os.environ.get("REDIS_SOCKET_TIMEOUT", 2.0))
+    REDIS_CONNECT_TIMEOUT: float = float(os.environ.get("REDIS_CONNECT_TIMEOUT", 1.0))
+    REDIS_HEALTH_CHECK_INTERVAL: int = int(os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", 30))
+    REDIS_RETRY_ATTEMPTS: int = int(os.environ.get("REDIS_RETRY_ATTEMPTS", 2))
+    REDIS_RECONNECT_BACKOFF: float = float(os.environ.get("REDIS_RECONNECT_BACKOFF", 5.0))
     
     GITHUB_TOKEN: str = os.environ.get("GITHUB_TOKEN", "")
     GITHUB_WEBHOOK_SECRET: str = os.environ.get("GITHUB_WEBHOOK_SECRET", "")
+    GITHUB_MAX_CONNECTIONS: int = int(os.environ.get("GITHUB_MAX_CONNECTIONS", 20))
+    GITHUB_CONNECTIONS_PER_HOST: int = int(os.environ.get("GITHUB_CONNECTIONS_PER_HOST", 10))
+    GITHUB_KEEPALIVE_TIMEOUT: float = float(os.environ.get("GITHUB_KEEPALIVE_TIMEOUT", 30.0))
+    GITHUB_DNS_CACHE_TTL: int = int(os.environ.get("GITHUB_DNS_CACHE_TTL", 300))
+    GITHUB_TIMEOUT: float = float(os.environ.get("GITHUB_TIMEOUT", 30.0))
+    GITHUB_CONNECT_TIMEOUT: float = float(os.environ.get("GITHUB_CONNECT_TIMEOUT", 5.0))
+    GITHUB_FETCH_CONCURRENCY: int = int(os.environ.get("GITHUB_FETCH_CONCURRENCY", 8))
+    GITHUB_FILE_TIMEOUT: float = float(os.environ.get("GITHUB_FILE_TIMEOUT", 10.0))
+    GITHUB_CACHE_ENABLED: bool = os.environ.get("GITHUB_CACHE_ENABLED", "true").lower() == "true"
+    GITHUB_CACHE_TTL: int = int(os.environ.get("GITHUB_CACHE_TTL", 60 * 60 * 24 * 7))
+    PR_DIFF_CONTEXT_LINES: int = int(os.environ.get("PR_DIFF_CONTEXT_LINES", 3))
+    PR_FULL_FILE_MAX_LINES: int = int(os.environ.get("PR_FULL_FILE_MAX_LINES", 200))
+    PR_MAX_FILES: int = int(os.environ.get("PR_MAX_FILES", 5))
+    PR_FILE_MAX_CHANGES: int = int(os.environ.get("PR_FILE_MAX_CHANGES", 1500))
     
     RATE_LIMIT: int = int(os.environ.get("RATE_LIMIT", 10))
     RATE_LIMIT_WINDOW: int = int(os.environ.get("RATE_LIMIT_WINDOW", 1))
+    RATE_LIMIT_ALGORITHM: str = os.environ.get("RATE_LIMIT_ALGORITHM", "sliding_window")
+    RATE_LIMIT_BURST: int = int(os.environ.get("RATE_LIMIT_BURST", 0))
+    RATE_LIMIT_REVIEW: int = int(os.environ.get("RATE_LIMIT_REVIEW", 0))
+    RATE_LIMIT_FEEDBACK: int = int(os.environ.get("RATE_LIMIT_FEEDBACK", 30))
+    RATE_LIMIT_MODE: str = os.environ.get("RATE_LIMIT_MODE", "redis")
+    RATE_LIMIT_LEASE_FRACTION: float = float(os.environ.get("RATE_LIMIT_LEASE_FRACTION", 0.1))
+    RATE_LIMIT_LEASE_TTL: float = float(os.environ.get("RATE_LIMIT_LEASE_TTL", 5.0))
+    RATE_LIMIT_LOCAL_SHARE: int = int(os.environ.get("RATE_LIMIT_LOCAL_SHARE", 1))
     
     CACHE_TTL: int = int(os.environ.get("CACHE_TTL", 3600))
+    BATCH_MAX_ITEMS: int = int(os.environ.get("BATCH_MAX_ITEMS", 50))
+    BATCH_CONCURRENCY: int = int(os.environ.get("BATCH_CONCURRENCY", 4))
+    
+    REVIEW_CHUNK_TOKENS: int = int(os.environ.get("REVIEW_CHUNK_TOKENS", 6000))
+    REVIEW_CHUNK_OVERLAP_LINES: int = int(os.environ.get("REVIEW_CHUNK_OVERLAP_LINES", 5))
+    REVIEW_CHUNK_REDUCE: bool = os.environ.get("REVIEW_CHUNK_REDUCE", "true").lower() == "true"
+    REVIEW_FANOUT_CONCURRENCY: int = int(os.environ.get("REVIEW_FANOUT_CONCURRENCY", 4))
+    
+    HISTORY_MAX_TURNS: int = int(os.environ.get("HISTORY_MAX_TURNS", 20))
+    HISTORY_LOAD_TURNS: int = int(os.environ.get("HISTORY_LOAD_TURNS", 10))
+    HISTORY_TOKEN_BUDGET: int = int(os.environ.get("HISTORY_TOKEN_BUDGET", 1500))
+    HISTORY_TTL: int = int(os.environ.get("HISTORY_TTL", 60 * 60 * 24 * 7))
+    
+    FEEDBACK_STREAM: str = os.environ.get("FEEDBACK_STREAM", "feedback:stream")
+    FEEDBACK_STREAM_MAXLEN: int = int(os.environ.get("FEEDBACK_STREAM_MAXLEN", 100000))
+    FEEDBACK_CONSUMER_GROUP: str = os.environ.get("FEEDBACK_CONSUMER_GROUP", "feedback-aggregator")
+    FEEDBACK_CLAIM_IDLE_SECONDS: float = float(os.environ.get("FEEDBACK_CLAIM_IDLE_SECONDS", 60.0))
+    FEEDBACK_CLAIM_INTERVAL: float = float(os.environ.get("FEEDBACK_CLAIM_INTERVAL", 30.0))
+    FEEDBACK_STATS_RETENTION_DAYS: int = int(os.environ.get("FEEDBACK_STATS_RETENTION_DAYS", 30))
+    REVIEW_META_TTL: int = int(os.environ.get("REVIEW_META_TTL", 60 * 60 * 24 * 7))
+    
+    CACHE_SERIALIZER: str = os.environ.get("CACHE_SERIALIZER", "msgpack")
+    CACHE_COMPRESSION: str = os.environ.get("CACHE_COMPRESSION", "zlib")
+    CACHE_COMPRESSION_THRESHOLD: int = int(os.environ.get("CACHE_COMPRESSION_THRESHOLD", 1024))
+    L1_CACHE_MAX_ENTRIES: int = int(os.environ.get("L1_CACHE_MAX_ENTRIES", 1024))
+    L1_CACHE_MAX_BYTES: int = int(os.environ.get("L1_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+    L1_CACHE_TTL: int = int(os.environ.get("L1_CACHE_TTL", 300))
+    SINGLE_FLIGHT_LOCK_TTL: int = int(os.environ.get("SINGLE_FLIGHT_LOCK_TTL", 90))
+    SINGLE_FLIGHT_WAIT_TIMEOUT: float = float(os.environ.get("SINGLE_FLIGHT_WAIT_TIMEOUT", 60.0))
+    CACHE_ADMIN_TOKEN: str = os.environ.get("CACHE_ADMIN_TOKEN", "")
+    CACHE_INVALIDATION_CHANNEL: str = os.environ.get("CACHE_INVALIDATION_CHANNEL", "codesage:cache-invalidation")
     
     model_config = SettingsConfigDict(env_file=".env")
 
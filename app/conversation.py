@@ -0,0 +1,55 @@
+from typing import Any, Dict, List
+from .models import CodeReviewResponse
+from .tokens import estimate_tokens
+
+NO_HISTORY = "No previous reviews in this session."
+
+def make_turn(language: str, response: CodeReviewResponse) -> Dict[str, Any]:
+    return {
+        "request_id": response.request_id,
+        "timestamp": response.timestamp,
+        "language": language,
+        "bugs": [
+            {"line": bug.line, "severity": bug.severity, "description": bug.description}
+            for bug in response.bugs_detected
+        ],
+        "suggestions": [suggestion.description for suggestion in response.suggestions]
+    }
+
+def _detailed(turn: Dict[str, Any]) -> str:
+    lines = [f"Review {turn['request_id'][:8]} ({turn['language']}):"]
+    lines += [f"- Line {b['line']} [{b['severity']}]: {b['description']}" for b in turn["bugs"]]
+    lines += [f"- Suggestion: {s}" for s in turn["suggestions"]]
+    if len(lines) == 1:
+        lines.append("- No issues reported")
+    return "\n".join(lines)
+
+def _summarized(turn: Dict[str, Any]) -> str:
+    topics = "; ".join(b["description"][:60] for b in turn["bugs"][:3])
+    summary = f"Review {turn['request_id'][:8]} ({turn['language']}): {len(turn['bugs'])} bugs, {len(turn['suggestions'])} suggestions"
+    return f"{summary} ({topics})" if topics else summary
+
+def build_history_context(turns: List[Dict[str, Any]], budget_tokens: int) -> str:
+    # Turns arrive newest first. Recent turns are listed finding by finding
+    # while they fit in half of the budget; older ones collapse to a
+    # one-line summary, and whatever does not fit is dropped.
+    sections = []
+    used = 0
+    detailed = True
+    
+    for index, turn in enumerate(turns):
+        if detailed:
+            text = _detailed(turn)
+            if used + estimate_tokens(text) > budget_tokens // 2:
+                detailed = False
+        if not detailed:
+            text = _summarized(turn)
+        
+        cost = estimate_tokens(text)
+        if used + cost > budget_tokens:
+            sections.append(f"({len(turns) - index} older reviews omitted)")
+            break
+        sections.append(text)
+        used += cost
+    
+    return "\n\n".join(sections) if sections else NO_HISTORY
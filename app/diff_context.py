@@ -0,0 +1,120 @@
+import os
+import re
+from typing import Dict, Any, Iterable, List, NamedTuple, Optional
+
+# GitHub generates the per-file patches with this many lines of context.
+PATCH_CONTEXT_LINES = 3
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+class Hunk(NamedTuple):
+    old_start: int
+    new_start: int
+    lines: List[str]
+
+    @property
+    def old_count(self) -> int:
+        return sum(1 for line in self.lines if not line.startswith("+"))
+
+    @property
+    def new_count(self) -> int:
+        return sum(1 for line in self.lines if not line.startswith("-"))
+
+def parse_patch(patch: str) -> List[Hunk]:
+    hunks: List[Hunk] = []
+    for line in patch.splitlines():
+        match = _HUNK_HEADER.match(line)
+        if match:
+            hunks.append(Hunk(int(match.group(1)), int(match.group(3)), []))
+        elif hunks and not line.startswith("\\"):
+            hunks[-1].lines.append(line if line else " ")
+    return hunks
+
+def _edge_context(lines: Iterable[str]) -> int:
+    count = 0
+    for line in lines:
+        if not line.startswith(" "):
+            break
+        count += 1
+    return count
+
+def _trim(hunk: Hunk, window: int) -> Hunk:
+    lead = _edge_context(hunk.lines)
+    trail = _edge_context(reversed(hunk.lines))
+    if lead == len(hunk.lines):
+        return hunk
+    drop_lead = max(lead - window, 0)
+    drop_trail = max(trail - window, 0)
+    return Hunk(
+        hunk.old_start + drop_lead,
+        hunk.new_start + drop_lead,
+        hunk.lines[drop_lead:len(hunk.lines) - drop_trail]
+    )
+
+def _widen(hunks: List[Hunk], content: List[str], window: int) -> List[Hunk]:
+    widened = []
+    covered = 0
+    for index, hunk in enumerate(hunks):
+        lead = _edge_context(hunk.lines)
+        trail = _edge_context(reversed(hunk.lines))
+        new_end = hunk.new_start + hunk.new_count - 1
+        next_start = hunks[index + 1].new_start if index + 1 < len(hunks) else len(content) + 1
+        
+        # Extra lines come from the new file and never overlap a
+        # neighbouring hunk.
+        before_start = max(hunk.new_start - max(window - lead, 0), covered + 1, 1)
+        after_end = min(new_end + max(window - trail, 0), next_start - 1, len(content))
+        before = [" " + line for line in content[before_start - 1:hunk.new_start - 1]]
+        after = [" " + line for line in content[new_end:after_end]]
+        
+        lines = before + hunk.lines + after
+        if widened and covered + 1 == hunk.new_start - len(before):
+            # Hunks whose context now touches are rendered as one.
+            previous = widened.pop()
+            widened.append(Hunk(previous.old_start, previous.new_start, previous.lines + lines))
+        else:
+            widened.append(Hunk(hunk.old_start - len(before), hunk.new_start - len(before), lines))
+        covered = max(after_end, new_end)
+    return widened
+
+def render_hunks(hunks: List[Hunk]) -> str:
+    return "\n".join(
+        f"@@ -{hunk.old_start},{hunk.old_count} +{hunk.new_start},{hunk.new_count} @@\n" + "\n".join(hunk.lines)
+        for hunk in hunks
+    )
+
+def needs_content(file: Dict[str, Any], window: int) -> bool:
+    if file.get("status") == "removed":
+        return False
+    if not file.get("patch"):
+        # Binary files and diffs GitHub considers too large come without a
+        # patch; the file itself is the only source.
+        return True
+    return window > PATCH_CONTEXT_LINES and file.get("status") != "added"
+
+def file_section(file: Dict[str, Any], content: Optional[str], window: int, max_full_lines: int) -> str:
+    filename = file["filename"]
+    _, ext = os.path.splitext(filename)
+    language = ext[1:] if ext else "text"
+    patch = file.get("patch")
+    content_lines = content.splitlines() if content else None
+    
+    if not patch:
+        if content_lines is None:
+            return ""
+        if len(content_lines) > max_full_lines:
+            shown = "\n".join(content_lines[:max_full_lines])
+            return f"\n--- {filename} (first {max_full_lines} of {len(content_lines)} lines) ---\n```{language}\n{shown}\n```\n"
+        return f"\n--- {filename} ---\n```{language}\n{content}\n```\n"
+    
+    hunks = parse_patch(patch)
+    if content_lines is not None and len(content_lines) <= max_full_lines:
+        # Small files are shown whole, with the changed lines still marked.
+        hunks = _widen(hunks, content_lines, len(content_lines))
+    elif content_lines is not None and window > PATCH_CONTEXT_LINES:
+        hunks = _widen(hunks, content_lines, window)
+    elif window < PATCH_CONTEXT_LINES:
+        hunks = [_trim(hunk, window) for hunk in hunks]
+    
+    status = file.get("status", "modified")
+    return f"\n--- {filename} ({status}) ---\n```diff\n{render_hunks(hunks)}\n```\n"
@@ -0,0 +1,132 @@
+import io
+import re
+import hashlib
+import tokenize
+from typing import Dict, List, Optional
+from .config import settings
+from .prompts import CODE_REVIEW_PROMPT, STRUCTURED_REVIEW_PROMPT
+
+PROMPT_VERSION = hashlib.sha256((CODE_REVIEW_PROMPT + STRUCTURED_REVIEW_PROMPT).encode()).hexdigest()[:12]
+
+# Comment and string syntax for the languages offered in the UI. Strings are
+# copied verbatim so that comment markers inside them are not stripped.
+_DEFAULT_SYNTAX = {"line": ("//",), "block": (("/*", "*/"),), "quotes": ('"', "'")}
+_LANGUAGE_SYNTAX = {
+    "python": {"line": ("#",), "block": (), "quotes": ('"', "'")},
+    "ruby": {"line": ("#",), "block": (("=begin", "=end"),), "quotes": ('"', "'")},
+    "php": {"line": ("//", "#"), "block": (("/*", "*/"),), "quotes": ('"', "'")},
+    "javascript": {"line": ("//",), "block": (("/*", "*/"),), "quotes": ('"', "'", "`")},
+    "typescript": {"line": ("//",), "block": (("/*", "*/"),), "quotes": ('"', "'", "`")},
+    "go": {"line": ("//",), "block": (("/*", "*/"),), "quotes": ('"', "'", "`")},
+    "rust": {"line": ("//",), "block": (("/*", "*/"),), "quotes": ('"',)},
+    "css": {"line": (), "block": (("/*", "*/"),), "quotes": ('"', "'")},
+    "html": {"line": (), "block": (("<!--", "-->"),), "quotes": ()},
+}
+
+# Line structure is kept so that a normalized hit never serves line numbers
+# for code that has moved; only whitespace within a line, line endings and
+# comments are ignored.
+_SKIPPED_PYTHON_TOKENS = {tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.ENCODING, tokenize.ENDMARKER}
+
+def _normalize_python(code: str) -> str:
+    lines: Dict[int, List[str]] = {}
+    for token in tokenize.generate_tokens(io.StringIO(code).readline):
+        if token.type in _SKIPPED_PYTHON_TOKENS:
+            continue
+        if token.type == tokenize.INDENT:
+            text = "<indent>"
+        elif token.type == tokenize.DEDENT:
+            text = "<dedent>"
+        else:
+            # Multi-line strings keep their newlines, so later lines stay put.
+            text = token.string
+        lines.setdefault(token.start[0], []).append(text)
+    rows = max(lines, default=0)
+    return "\n".join(" ".join(lines.get(row, [])) for row in range(1, rows + 1)).rstrip("\n")
+
+def _normalize_generic(code: str, language: str) -> str:
+    syntax = _LANGUAGE_SYNTAX.get(language, _DEFAULT_SYNTAX)
+    out = []
+    i = 0
+    length = len(code)
+    # Whitespace runs within a line collapse to one space; newlines are kept.
+    pending_space = False
+    
+    while i < length:
+        char = code[i]
+        
+        if char == "\n":
+            out.append("\n")
+            pending_space = False
+            i += 1
+            continue
+        if char.isspace():
+            pending_space = True
+            i += 1
+            continue
+        
+        line_marker = next((m for m in syntax["line"] if code.startswith(m, i)), None)
+        if line_marker:
+            end = code.find("\n", i)
+            i = length if end == -1 else end
+            continue
+        
+        block = next((b for b in syntax["block"] if code.startswith(b[0], i)), None)
+        if block:
+            end = code.find(block[1], i + len(block[0]))
+            end = length if end == -1 else end + len(block[1])
+            newlines = code.count("\n", i, end)
+            if newlines:
+                out.append("\n" * newlines)
+                pending_space = False
+            else:
+                pending_space = True
+            i = end
+            continue
+        
+        if pending_space and out and not out[-1].endswith("\n"):
+            out.append(" ")
+        pending_space = False
+        
+        if char in syntax["quotes"]:
+            start = i
+            i += 1
+            while i < length and code[i] != char:
+                i += 2 if code[i] == "\\" else 1
+            i += 1
+            out.append(code[start:i])
+            continue
+        
+        out.append(char)
+        i += 1
+    
+    return "".join(out).rstrip("\n")
+
+def normalize_code(code: str, language: str) -> str:
+    language = language.strip().lower()
+    code = code.replace("\r\n", "\n").replace("\r", "\n")
+    
+    if language == "python":
+        try:
+            return _normalize_python(code)
+        except (tokenize.TokenError, IndentationError, SyntaxError):
+            pass
+    return _normalize_generic(code, language)
+
+def normalize_context(context: Optional[str]) -> str:
+    return re.sub(r"\s+", " ", context or "").strip()
+
+def source_digest(code: str) -> str:
+    return hashlib.sha256(code.encode()).hexdigest()
+
+def review_fingerprint(code: str, language: str, context: Optional[str] = None, *variant: str) -> str:
+    parts = [
+        PROMPT_VERSION,
+        settings.LLM_BACKEND,
+        settings.GEMINI_MODEL,
+        language.strip().lower(),
+        normalize_context(context),
+        *variant,
+        normalize_code(code, language)
+    ]
+    return hashlib.sha256("\x00".join(parts).encode()).hexdigest()
@@ -0,0 +1,73 @@
+import logging
+from typing import Any, Dict, NamedTuple, Optional
+from .config import settings
+from .redis_pool import RedisPool
+from .cache_codec import CacheCodec
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class CachedResponse(NamedTuple):
+    etag: Optional[str]
+    last_modified: Optional[str]
+    body: str
+    next_url: Optional[str]
+
+class GitHubResponseCache:
+    def __init__(self, redis_pool: RedisPool):
+        self.redis_pool = redis_pool
+        self.redis_client = redis_pool.client
+        self.ttl = settings.GITHUB_CACHE_TTL
+        self.codec = CacheCodec(
+            serializer=settings.CACHE_SERIALIZER,
+            compression=settings.CACHE_COMPRESSION,
+            threshold=settings.CACHE_COMPRESSION_THRESHOLD
+        )
+    
+    @staticmethod
+    def key(url: str, params: Optional[Dict[str, Any]], accept: str) -> str:
+        query = "&".join(f"{name}={value}" for name, value in sorted((params or {}).items()))
+        return f"github-http:{accept}:{url}?{query}"
+    
+    def conditional_headers(self, cached: Optional[CachedResponse]) -> Dict[str, str]:
+        if cached is None:
+            return {}
+        if cached.etag:
+            return {"If-None-Match": cached.etag}
+        return {"If-Modified-Since": cached.last_modified}
+    
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        if not self.redis_pool.available:
+            return None
+        
+        try:
+            cached = await self.redis_client.get(key)
+            return CachedResponse(**self.codec.decode(cached)) if cached else None
+        except Exception as e:
+            self.redis_pool.record_failure(e)
+            logger.error(f"Error reading cached GitHub response: {e}")
+            return None
+    
+    async def touch(self, key: str) -> None:
+        # A revalidated entry is still hot, so it gets a fresh TTL.
+        if not self.redis_pool.available:
+            return
+        
+        try:
+            await self.redis_client.expire(key, self.ttl)
+        except Exception as e:
+            self.redis_pool.record_failure(e)
+            logger.error(f"Error refreshing cached GitHub response: {e}")
+    
+    async def set(self, key: str, response: CachedResponse) -> None:
+        # Only validators make an entry useful; without them GitHub can never
+        # answer 304 and the body would just be dead weight.
+        if not (response.etag or response.last_modified) or not self.redis_pool.available:
+            return
+        
+        try:
+            encoded = self.codec.encode(response._asdict(), keyspace="github")
+            await self.redis_client.setex(key, self.ttl, encoded)
+        except Exception as e:
+            self.redis_pool.record_failure(e)
+            logger.error(f"Error caching GitHub response: {e}")
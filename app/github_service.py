@@ -1,76 +1,296 @@
-import os
+import json
+import time
+import asyncio
 import logging
 import aiohttp
-from typing import Dict, Any, List
+from contextlib import contextmanager
+from typing import Dict, Any, AsyncIterator, Iterator, List, NamedTuple, Optional, Set, Tuple
 from .config import settings
+from .metrics import (
+    GITHUB_REQUESTS,
+    GITHUB_REQUEST_LATENCY,
+    GITHUB_CONNECTIONS,
+    GITHUB_CACHE_REQUESTS,
+    GITHUB_RATE_LIMIT_REMAINING,
+    PR_REVIEW_STAGE_SECONDS,
+    PR_REVIEWS_SUPERSEDED,
+    PR_PROMPT_TOKENS,
+    PR_FILES_LISTED,
+    PR_FILES_FILTERED
+)
+from .redis_pool import RedisPool
+from .github_cache import CachedResponse, GitHubResponseCache
+from .pr_files import exclusion_reason, rank_files
+from .diff_context import needs_content, file_section
+from .tokens import estimate_tokens
 from .llm_service import LLMService
+from .admission import BULK
 from .prompts import PULL_REQUEST_REVIEW_PROMPT
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# The pull request files endpoint pages at most 100 files and stops at 3000.
+PR_FILES_PAGE_SIZE = 100
+PR_FILES_LIMIT = 3000
+
+class GitHubResponse(NamedTuple):
+    status: int
+    body: str
+    next_url: Optional[str]
+
+def _trace_config() -> aiohttp.TraceConfig:
+    trace = aiohttp.TraceConfig()
+    
+    async def on_request_start(session, ctx, params):
+        ctx.started = time.perf_counter()
+        ctx.endpoint = (ctx.trace_request_ctx or {}).get("endpoint", "other")
+    
+    async def on_connection_create_end(session, ctx, params):
+        GITHUB_CONNECTIONS.labels(endpoint=ctx.endpoint, reused="false").inc()
+    
+    async def on_connection_reuseconn(session, ctx, params):
+        GITHUB_CONNECTIONS.labels(endpoint=ctx.endpoint, reused="true").inc()
+    
+    async def on_request_end(session, ctx, params):
+        GITHUB_REQUEST_LATENCY.labels(endpoint=ctx.endpoint).observe(time.perf_counter() - ctx.started)
+        GITHUB_REQUESTS.labels(endpoint=ctx.endpoint, status=str(params.response.status)).inc()
+        remaining = params.response.headers.get("X-RateLimit-Remaining")
+        if remaining is not None:
+            resource = params.response.headers.get("X-RateLimit-Resource", "core")
+            GITHUB_RATE_LIMIT_REMAINING.labels(resource=resource).set(int(remaining))
+    
+    async def on_request_exception(session, ctx, params):
+        GITHUB_REQUEST_LATENCY.labels(endpoint=ctx.endpoint).observe(time.perf_counter() - ctx.started)
+        GITHUB_REQUESTS.labels(endpoint=ctx.endpoint, status="error").inc()
+    
+    trace.on_request_start.append(on_request_start)
+    trace.on_connection_create_end.append(on_connection_create_end)
+    trace.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace.on_request_end.append(on_request_end)
+    trace.on_request_exception.append(on_request_exception)
+    return trace
+
+@contextmanager
+def _timed(timings: Dict[str, float], stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = time.perf_counter() - started
+        PR_REVIEW_STAGE_SECONDS.labels(stage=stage).observe(timings[stage])
+
 class GitHubService:
-    def __init__(self):
+    def __init__(self, redis_pool: Optional[RedisPool] = None):
         self.github_token = settings.GITHUB_TOKEN
         self.headers = {
             "Authorization": f"token {self.github_token}",
             "Accept": "application/vnd.github.v3+json"
         }
         self.api_base_url = "https://api.github.com"
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._reviews: Dict[Tuple[str, int], asyncio.Task] = {}
+        self._superseded: Set[asyncio.Task] = set()
+        self.http_cache = GitHubResponseCache(redis_pool) if redis_pool and settings.GITHUB_CACHE_ENABLED else None
     
-    async def get_pr_diff(self, repo_full_name: str, pr_number: int) -> str:
-        url = f"{self.api_base_url}/repos/{repo_full_name}/pulls/{pr_number}"
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Created on first use so it binds to the running event loop; the
+        # app lifespan closes it.
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.GITHUB_MAX_CONNECTIONS,
+                limit_per_host=settings.GITHUB_CONNECTIONS_PER_HOST,
+                keepalive_timeout=settings.GITHUB_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=settings.GITHUB_DNS_CACHE_TTL
+            )
+            self._session = aiohttp.ClientSession(
+                base_url=self.api_base_url,
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(
+                    total=settings.GITHUB_TIMEOUT,
+                    connect=settings.GITHUB_CONNECT_TIMEOUT
+                ),
+                trace_configs=[_trace_config()]
+            )
+        return self._session
+    
+    async def close(self) -> None:
+        for task in self._reviews.values():
+            task.cancel()
+        await asyncio.gather(*self._reviews.values(), return_exceptions=True)
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    async def _get(
+        self,
+        url: str,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        accept: Optional[str] = None
+    ) -> GitHubResponse:
+        # Conditional requests: a 304 costs no rate limit quota and carries
+        # no body, so the cached one is served instead.
+        headers = {"Accept": accept} if accept else {}
+        cache_key = cached = None
+        if self.http_cache is not None:
+            cache_key = self.http_cache.key(url, params, accept or self.headers["Accept"])
+            cached = await self.http_cache.get(cache_key)
+            headers.update(self.http_cache.conditional_headers(cached))
+        
+        async with self.session.get(
+            url,
+            params=params,
+            headers=headers,
+            trace_request_ctx={"endpoint": endpoint}
+        ) as response:
+            status = response.status
+            if status != 304:
+                body = await response.text()
+                next_link = response.links.get("next")
+                next_url = next_link["url"].path_qs if next_link else None
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url, 
-                headers={"Authorization": f"token {self.github_token}", 
-                         "Accept": "application/vnd.github.v3.diff"}
-            ) as response:
-                if response.status != 200:
-                    logger.error(f"Error fetching PR diff: {await response.text()}")
-                    return ""
-                return await response.text()
+        if cache_key is None:
+            return GitHubResponse(status, body, next_url)
+        if status == 304 and cached is not None:
+            GITHUB_CACHE_REQUESTS.labels(endpoint=endpoint, result="hit").inc()
+            await self.http_cache.touch(cache_key)
+            return GitHubResponse(200, cached.body, cached.next_url)
+        
+        GITHUB_CACHE_REQUESTS.labels(endpoint=endpoint, result="miss").inc()
+        if status == 200:
+            await self.http_cache.set(cache_key, CachedResponse(etag, last_modified, body, next_url))
+        return GitHubResponse(status, body, next_url)
+    
+    async def get_pr_diff(self, repo_full_name: str, pr_number: int) -> str:
+        response = await self._get(
+            f"/repos/{repo_full_name}/pulls/{pr_number}",
+            "pr_diff",
+            accept="application/vnd.github.v3.diff"
+        )
+        if response.status != 200:
+            logger.error(f"Error fetching PR diff: {response.body}")
+            return ""
+        return response.body
+    
+    async def iter_pr_files(self, repo_full_name: str, pr_number: int) -> AsyncIterator[Dict[str, Any]]:
+        url: Optional[str] = f"/repos/{repo_full_name}/pulls/{pr_number}/files"
+        params: Optional[Dict[str, Any]] = {"per_page": PR_FILES_PAGE_SIZE}
+        listed = 0
+        while url and listed < PR_FILES_LIMIT:
+            response = await self._get(url, "pr_files", params=params)
+            if response.status != 200:
+                logger.error(f"Error fetching PR files: {response.body}")
+                return
+            page = json.loads(response.body)
+            for file in page:
+                yield file
+            listed += len(page)
+            # The next link already carries the paging params.
+            url = response.next_url
+            params = None
     
     async def get_pr_files(self, repo_full_name: str, pr_number: int) -> List[Dict[str, Any]]:
-        url = f"{self.api_base_url}/repos/{repo_full_name}/pulls/{pr_number}/files"
+        return [file async for file in self.iter_pr_files(repo_full_name, pr_number)]
+    
+    async def select_pr_files(self, repo_full_name: str, pr_number: int) -> List[Dict[str, Any]]:
+        candidates = []
+        listed = 0
+        async for file in self.iter_pr_files(repo_full_name, pr_number):
+            listed += 1
+            reason = exclusion_reason(file, settings.PR_FILE_MAX_CHANGES)
+            if reason:
+                PR_FILES_FILTERED.labels(reason=reason).inc()
+            else:
+                candidates.append(file)
+        PR_FILES_LISTED.observe(listed)
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=self.headers) as response:
-                if response.status != 200:
-                    logger.error(f"Error fetching PR files: {await response.text()}")
-                    return []
-                return await response.json()
+        selected = rank_files(candidates, settings.PR_MAX_FILES)
+        logger.info(f"Selected {len(selected)} of {listed} files for review ({len(candidates)} candidates)")
+        return selected
     
     async def get_file_content(self, repo_full_name: str, path: str, ref: str) -> str:
-        url = f"{self.api_base_url}/repos/{repo_full_name}/contents/{path}?ref={ref}"
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=self.headers) as response:
-                if response.status != 200:
-                    logger.error(f"Error fetching file content: {await response.text()}")
-                    return ""
-                data = await response.json()
-                if data.get("encoding") == "base64":
-                    import base64
-                    return base64.b64decode(data.get("content", "")).decode("utf-8")
-                return ""
+        response = await self._get(
+            f"/repos/{repo_full_name}/contents/{path}",
+            "file_content",
+            params={"ref": ref}
+        )
+        if response.status != 200:
+            logger.error(f"Error fetching file content: {response.body}")
+            return ""
+        data = json.loads(response.body)
+        if data.get("encoding") == "base64":
+            import base64
+            return base64.b64decode(data.get("content", "")).decode("utf-8")
+        return ""
     
     async def create_pr_comment(self, repo_full_name: str, pr_number: int, comment: str) -> bool:
-        url = f"{self.api_base_url}/repos/{repo_full_name}/issues/{pr_number}/comments"
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                url,
-                headers=self.headers,
-                json={"body": comment}
-            ) as response:
-                if response.status != 201:
-                    logger.error(f"Error creating PR comment: {await response.text()}")
-                    return False
-                return True
+        async with self.session.post(
+            f"/repos/{repo_full_name}/issues/{pr_number}/comments",
+            json={"body": comment},
+            trace_request_ctx={"endpoint": "pr_comment"}
+        ) as response:
+            if response.status != 201:
+                logger.error(f"Error creating PR comment: {await response.text()}")
+                return False
+            return True
+    
+    async def _fetch_file(self, semaphore: asyncio.Semaphore, repo_full_name: str, path: str, ref: str) -> str:
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(
+                    self.get_file_content(repo_full_name, path, ref),
+                    timeout=settings.GITHUB_FILE_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"Timed out fetching {path} from {repo_full_name}")
+            except aiohttp.ClientError as e:
+                logger.warning(f"Error fetching {path} from {repo_full_name}: {e}")
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                # Non-UTF-8 files and malformed responses only lose this file.
+                logger.warning(f"Could not decode {path} from {repo_full_name}: {e}")
+            return ""
+    
+    async def fetch_file_contents(self, repo_full_name: str, paths: List[str], ref: str) -> List[str]:
+        semaphore = asyncio.Semaphore(settings.GITHUB_FETCH_CONCURRENCY)
+        return await asyncio.gather(*[
+            self._fetch_file(semaphore, repo_full_name, path, ref)
+            for path in paths
+        ])
     
     async def process_pull_request(self, payload: Dict[str, Any], llm_service: LLMService) -> None:
+        # A new push to the same PR makes an in-flight review of the old head
+        # pointless, so it is cancelled.
+        key = (payload["repository"]["full_name"], payload["pull_request"]["number"])
+        previous = self._reviews.get(key)
+        if previous is not None and not previous.done():
+            # Marked so its waiter can tell a supersession from a shutdown.
+            self._superseded.add(previous)
+            previous.cancel()
+        
+        task = asyncio.create_task(self._review_pull_request(payload, llm_service))
+        self._reviews[key] = task
+        try:
+            await asyncio.wait([task])
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            if self._reviews.get(key) is task:
+                del self._reviews[key]
+            superseded = task in self._superseded
+            self._superseded.discard(task)
+        
+        if superseded:
+            PR_REVIEWS_SUPERSEDED.inc()
+            logger.info(f"Review of PR #{key[1]} in {key[0]} was superseded by a newer push")
+    
+    async def _review_pull_request(self, payload: Dict[str, Any], llm_service: LLMService) -> None:
+        timings: Dict[str, float] = {}
         try:
             pr = payload["pull_request"]
             repo = payload["repository"]
@@ -81,40 +301,25 @@ class GitHubService:
             pr_description = pr["body"] or "No description provided"
             pr_head_sha = pr["head"]["sha"]
             
-            pr_files = await self.get_pr_files(repo_full_name, pr_number)
+            with _timed(timings, "list_files"):
+                files_to_review = await self.select_pr_files(repo_full_name, pr_number)
             
-            files_to_review = []
-            important_extensions = ['.py', '.js', '.ts', '.java', '.go', '.cpp', '.c', '.h', '.cs', '.php', '.rb']
+            if not files_to_review:
+                logger.info(f"No reviewable files in PR #{pr_number} in {repo_full_name}")
+                return
             
-            for file in pr_files:
-                _, ext = os.path.splitext(file["filename"])
-                if ext in important_extensions:
-                    files_to_review.append(file)
-                    
-                    if len(files_to_review) >= 5:
-                        break
+            # Files are reviewed from their patches; contents are only
+            # fetched where the patch is missing or too narrow.
+            window = settings.PR_DIFF_CONTEXT_LINES
+            to_fetch = [file["filename"] for file in files_to_review if needs_content(file, window)]
+            with _timed(timings, "fetch_contents"):
+                contents = await self.fetch_file_contents(repo_full_name, to_fetch, pr_head_sha)
+            content_by_name = dict(zip(to_fetch, contents))
             
-            if len(files_to_review) < 5:
-                remaining_slots = 5 - len(files_to_review)
-                file_names_to_review = [f["filename"] for f in files_to_review]
-                
-                for file in pr_files:
-                    if file["filename"] not in file_names_to_review:
-                        files_to_review.append(file)
-                        remaining_slots -= 1
-                        
-                        if remaining_slots <= 0:
-                            break
-            
-            files_content = ""
-            for file in files_to_review:
-                filename = file["filename"]
-                _, ext = os.path.splitext(filename)
-                language = ext[1:] if ext else "text"
-                
-                content = await self.get_file_content(repo_full_name, filename, pr_head_sha)
-                if content:
-                    files_content += f"\n--- {filename} ---\n```{language}\n{content}\n```\n"
+            files_content = "".join(
+                file_section(file, content_by_name.get(file["filename"]), window, settings.PR_FULL_FILE_MAX_LINES)
+                for file in files_to_review
+            )
             
             review_prompt = PULL_REQUEST_REVIEW_PROMPT.format(
                 repo=repo_full_name,
@@ -122,9 +327,10 @@ class GitHubService:
                 description=pr_description,
                 files=files_content
             )
+            PR_PROMPT_TOKENS.observe(estimate_tokens(review_prompt))
             
-            review_response = await llm_service.model.generate_content_async(review_prompt)
-            review_text = review_response.text
+            with _timed(timings, "llm"):
+                review_text = await llm_service.generate(review_prompt, lane=BULK)
             
             comment = (
                 "# 🤖 Automated Code Review\n\n"
@@ -133,8 +339,12 @@ class GitHubService:
                 "_This review was automatically generated by CodeSage._"
             )
             
-            await self.create_pr_comment(repo_full_name, pr_number, comment)
+            with _timed(timings, "post_comment"):
+                await self.create_pr_comment(repo_full_name, pr_number, comment)
             logger.info(f"Created review comment on PR #{pr_number} in {repo_full_name}")
             
         except Exception as e:
             logger.error(f"Error processing pull request: {e}")
+        finally:
+            breakdown = " ".join(f"{stage}={seconds:.2f}s" for stage, seconds in timings.items())
+            logger.info(f"PR review timings: {breakdown}")
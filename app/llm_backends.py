@@ -0,0 +1,183 @@
+import math
+import json
+import random
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, Optional, Tuple, Type
+from .config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class LLMBackend(ABC):
+    name = "base"
+    model_name = "base"
+    transient_errors: Tuple[Type[BaseException], ...] = (ConnectionError,)
+    
+    async def ping(self) -> bool:
+        return True
+    
+    @abstractmethod
+    async def generate(
+        self,
+        prompt: str,
+        schema: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None
+    ) -> str:
+        ...
+    
+    @abstractmethod
+    async def stream(self, prompt: str, model: Optional[str] = None) -> AsyncIterator[str]:
+        # Awaiting opens the stream, so a failure to start can be retried
+        # before any text has been handed out.
+        ...
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+    
+    def __init__(self, api_key: str, model_name: str):
+        import google.generativeai as genai
+        from google.api_core import exceptions as google_exceptions
+        
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self.model_name = model_name
+        self._models = {model_name: genai.GenerativeModel(model_name)}
+        self.transient_errors = (
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.TooManyRequests,
+            google_exceptions.InternalServerError,
+            google_exceptions.GatewayTimeout,
+            google_exceptions.DeadlineExceeded,
+            ConnectionError,
+        )
+    
+    async def ping(self) -> bool:
+        # The SDK's model lookup is synchronous.
+        await asyncio.to_thread(self._genai.get_model, f"models/{self.model_name}")
+        return True
+    
+    def _model(self, name: Optional[str]):
+        name = name or self.model_name
+        if name not in self._models:
+            self._models[name] = self._genai.GenerativeModel(name)
+        return self._models[name]
+    
+    async def generate(
+        self,
+        prompt: str,
+        schema: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None
+    ) -> str:
+        if schema is None:
+            response = await self._model(model).generate_content_async(prompt)
+        else:
+            response = await self._model(model).generate_content_async(
+                prompt,
+                generation_config={"response_mime_type": "application/json", "response_schema": schema}
+            )
+        return response.text
+    
+    async def stream(self, prompt: str, model: Optional[str] = None) -> AsyncIterator[str]:
+        response = await self._model(model).generate_content_async(prompt, stream=True)
+        
+        async def chunks():
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        
+        return chunks()
+
+class FakeBackendError(ConnectionError):
+    pass
+
+class FakeBackend(LLMBackend):
+    name = "fake"
+    model_name = "fake"
+    transient_errors = (FakeBackendError,)
+    
+    FINDINGS = {
+        "bugs": [
+            {
+                "line": 1,
+                "description": "Potential division by zero if x is 0",
+                "severity": "medium",
+                "suggestion": "Add a check to ensure x is not zero before division."
+            }
+        ],
+        "suggestions": [
+            {
+                "description": "Consider using a docstring to document this function",
+                "code_snippet": None
+            }
+        ]
+    }
+    
+    def __init__(
+        self,
+        latency_ms: float,
+        latency_sigma: float,
+        tokens_per_second: float,
+        output_tokens: int,
+        error_rate: float,
+        seed: Optional[int] = None
+    ):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+    
+    async def _first_token(self) -> None:
+        # Time to first token is long-tailed, so it is drawn from a
+        # log-normal distribution around the configured median.
+        delay = self.random.lognormvariate(math.log(max(self.latency_ms, 1.0)), self.latency_sigma) / 1000
+        await asyncio.sleep(delay)
+        if self.random.random() < self.error_rate:
+            raise FakeBackendError("Simulated LLM backend failure")
+    
+    def _review_text(self) -> str:
+        findings = f"```json\n{json.dumps(self.FINDINGS, indent=2)}\n```"
+        filler_chars = max(self.output_tokens * 4 - len(findings), 0)
+        sentence = "This is a simulated review from the local fake backend. "
+        prose = (sentence * (filler_chars // len(sentence) + 1))[:filler_chars]
+        return f"## Review\n\n{prose}\n\n{findings}"
+    
+    async def generate(
+        self,
+        prompt: str,
+        schema: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None
+    ) -> str:
+        await self._first_token()
+        text = json.dumps(self.FINDINGS) if schema is not None else self._review_text()
+        await asyncio.sleep(len(text) / 4 / self.tokens_per_second)
+        return text
+    
+    async def stream(self, prompt: str, model: Optional[str] = None) -> AsyncIterator[str]:
+        await self._first_token()
+        text = self._review_text()
+        piece = 80
+        
+        async def chunks():
+            for start in range(0, len(text), piece):
+                await asyncio.sleep(piece / 4 / self.tokens_per_second)
+                yield text[start:start + piece]
+        
+        return chunks()
+
+def create_backend(name: str) -> LLMBackend:
+    if name == "gemini":
+        return GeminiBackend(settings.GEMINI_API_KEY, settings.GEMINI_MODEL)
+    if name == "fake":
+        logger.warning("Using the fake LLM backend - reviews are simulated")
+        return FakeBackend(
+            latency_ms=settings.FAKE_LLM_LATENCY_MS,
+            latency_sigma=settings.FAKE_LLM_LATENCY_SIGMA,
+            tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND,
+            output_tokens=settings.FAKE_LLM_OUTPUT_TOKENS,
+            error_rate=settings.FAKE_LLM_ERROR_RATE
+        )
+    raise ValueError(f"Unknown LLM backend: {name}")
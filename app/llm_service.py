@@ -1,77 +1,226 @@
-import google.generativeai as genai
-from google.api_core import retry_async
 import uuid
 import json
-from typing import Optional
+import time
+import asyncio
+from functools import partial
+from typing import Any, AsyncIterator, Dict, Optional, List, Tuple, Union
 import logging
 from .models import LLMReviewResult, BugInfo, Suggestion
 from .config import settings
-from .prompts import CODE_REVIEW_PROMPT
+from .prompts import (
+    CODE_REVIEW_PROMPT,
+    STRUCTURED_REVIEW_PROMPT,
+    INCREMENTAL_UNIT_CONTEXT,
+    CHUNK_CONTEXT,
+    CHUNK_REDUCE_PROMPT
+)
+from .code_units import CodeUnit, CodeChunk, split_units, split_chunks
+from .fingerprint import review_fingerprint
+from .conversation import NO_HISTORY
+from .tokens import estimate_tokens
+from .model_routing import STANDARD, TIERS, select_tier, next_tier, tier_model
+from .metrics import (
+    INCREMENTAL_UNITS,
+    REVIEW_CHUNKS,
+    CHUNK_REVIEW_LATENCY,
+    LLM_TIER_REQUESTS,
+    LLM_TIER_LATENCY,
+    LLM_TIER_TOKENS,
+    MODEL_ESCALATIONS
+)
+from .resilience import CircuitBreaker, RetryPolicy, gather_bounded
+from .admission import AdmissionController, INTERACTIVE, BULK
+from .llm_backends import create_backend
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# OpenAPI subset accepted by Gemini's response_schema; mirrors BugInfo and
+# Suggestion.
+STRUCTURED_REVIEW_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "bugs": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "line": {"type": "integer"},
+                    "description": {"type": "string"},
+                    "severity": {"type": "string", "enum": ["low", "medium", "high"]},
+                    "suggestion": {"type": "string", "nullable": True}
+                },
+                "required": ["line", "description", "severity"]
+            }
+        },
+        "suggestions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "description": {"type": "string"},
+                    "code_snippet": {"type": "string", "nullable": True}
+                },
+                "required": ["description"]
+            }
+        }
+    },
+    "required": ["bugs", "suggestions"]
+}
+
 class LLMService:
     def __init__(self):
         try:
-            genai.configure(api_key=settings.GEMINI_API_KEY)
-            self.model = genai.GenerativeModel('gemini-2.0-flash')
-            logger.info("Successfully initialized Gemini AI client")
+            self.backend = create_backend(settings.LLM_BACKEND)
+            self.breaker = CircuitBreaker(
+                self.backend.name,
+                failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                recovery_timeout=settings.LLM_CIRCUIT_RECOVERY_SECONDS
+            )
+            self.retry_policy = RetryPolicy(
+                self.backend.transient_errors,
+                max_attempts=settings.LLM_MAX_ATTEMPTS,
+                base_delay=settings.LLM_RETRY_BASE_DELAY,
+                max_delay=settings.LLM_RETRY_MAX_DELAY
+            )
+            self.admission = AdmissionController(
+                max_concurrency=settings.LLM_MAX_CONCURRENCY,
+                max_queue=settings.LLM_MAX_QUEUE,
+                weights={INTERACTIVE: settings.LLM_INTERACTIVE_WEIGHT, BULK: settings.LLM_BULK_WEIGHT},
+                reserved={INTERACTIVE: settings.LLM_INTERACTIVE_RESERVED}
+            )
+            logger.info(f"Successfully initialized {self.backend.name} LLM backend")
         except Exception as e:
-            logger.error(f"Failed to initialize Gemini AI client: {e}")
+            logger.error(f"Failed to initialize {settings.LLM_BACKEND} LLM backend: {e}")
             raise
     
-    @retry_async.AsyncRetry(predicate=retry_async.if_exception_type(Exception))
-
-    async def review_code(
+    def _build_prompt(
         self,
         code: str,
         language: str,
-        context: Optional[str] = None
-    ) -> LLMReviewResult:
-        try:
-            prompt = CODE_REVIEW_PROMPT.format(
-                language=language,
-                context=context if context else "No additional context provided",
-                code=code
+        context: Optional[str] = None,
+        history: Optional[str] = None,
+        mode: str = "full"
+    ) -> str:
+        template = STRUCTURED_REVIEW_PROMPT if mode == "structured" else CODE_REVIEW_PROMPT
+        return template.format(
+            language=language,
+            context=context if context else "No additional context provided",
+            history=history if history else NO_HISTORY,
+            code=code
+        )
+    
+    async def generate(
+        self,
+        prompt: str,
+        deadline: Optional[float] = None,
+        lane: str = INTERACTIVE,
+        schema: Optional[Dict[str, Any]] = None,
+        tier: str = STANDARD
+    ) -> str:
+        async with self.admission.slot(lane, deadline):
+            start_time = time.time()
+            text = await self.retry_policy.call(
+                lambda: self.backend.generate(prompt, schema, tier_model(tier)),
+                self.breaker,
+                deadline
             )
+            self._observe_tier(tier, prompt, text, start_time)
+            return text
+    
+    def _observe_tier(self, tier: str, prompt: str, text: str, start_time: float) -> None:
+        LLM_TIER_REQUESTS.labels(tier=tier).inc()
+        LLM_TIER_LATENCY.labels(tier=tier).observe(time.time() - start_time)
+        LLM_TIER_TOKENS.labels(tier=tier, direction="input").inc(estimate_tokens(prompt))
+        LLM_TIER_TOKENS.labels(tier=tier, direction="output").inc(estimate_tokens(text))
+    
+    def _parse_findings(self, json_content: str) -> Optional[Tuple[List[BugInfo], List[Suggestion]]]:
+        bugs_detected = []
+        suggestions = []
+        
+        try:
+            structured_data = json.loads(json_content)
             
-            response = await self.model.generate_content_async(prompt)
+            if "bugs" in structured_data:
+                for bug in structured_data["bugs"]:
+                    bugs_detected.append(
+                        BugInfo(
+                            line=bug.get("line", 0),
+                            description=bug.get("description", ""),
+                            severity=bug.get("severity", "medium"),
+                            suggestion=bug.get("suggestion")
+                        )
+                    )
             
-            review_text = response.text
+            if "suggestions" in structured_data:
+                for suggestion in structured_data["suggestions"]:
+                    suggestions.append(
+                        Suggestion(
+                            description=suggestion.get("description", ""),
+                            code_snippet=suggestion.get("code_snippet")
+                        )
+                    )
+        except Exception as parse_error:
+            logger.warning(f"Error parsing structured data: {parse_error}")
+            return None
+        
+        return bugs_detected, suggestions
+    
+    def _parse_review(self, review_text: str) -> Optional[Tuple[List[BugInfo], List[Suggestion]]]:
+        if "```json" not in review_text:
+            return None
+        json_content = review_text.split("```json")[1].split("```")[0].strip()
+        return self._parse_findings(json_content)
+    
+    async def review_code(
+        self,
+        code: str,
+        language: str,
+        context: Optional[str] = None,
+        history: Optional[str] = None,
+        deadline: Optional[float] = None,
+        mode: str = "full"
+    ) -> LLMReviewResult:
+        # The tier is derived from the whole submission, so every chunk of a
+        # large file goes to the same model.
+        tier = select_tier(code, language, mode)
+        if estimate_tokens(code) > settings.REVIEW_CHUNK_TOKENS:
+            return await self._review_chunked(code, language, context, history, deadline, mode, tier)
+        return await self._review_single(code, language, context, history, deadline, mode, tier)
+    
+    async def _review_single(
+        self,
+        code: str,
+        language: str,
+        context: Optional[str] = None,
+        history: Optional[str] = None,
+        deadline: Optional[float] = None,
+        mode: str = "full",
+        tier: str = STANDARD
+    ) -> LLMReviewResult:
+        try:
+            prompt = self._build_prompt(code, language, context, history, mode)
+            escalated = False
             
-            bugs_detected = []
-            suggestions = []
+            while True:
+                if mode == "structured":
+                    # Schema-constrained output is bare JSON with no prose.
+                    response_text = await self.generate(prompt, deadline, schema=STRUCTURED_REVIEW_SCHEMA, tier=tier)
+                    review_text = ""
+                    findings = self._parse_findings(response_text)
+                else:
+                    review_text = await self.generate(prompt, deadline, tier=tier)
+                    findings = self._parse_review(review_text)
+                
+                stronger = next_tier(tier)
+                if findings is not None or escalated or stronger is None or not settings.MODEL_ESCALATION:
+                    break
+                logger.warning(f"Unparseable review from the {tier} tier, escalating to {stronger}")
+                MODEL_ESCALATIONS.labels(from_tier=tier, to_tier=stronger).inc()
+                tier = stronger
+                escalated = True
             
-            try:
-                if "```json" in review_text:
-                    json_parts = review_text.split("```json")
-                    if len(json_parts) > 1:
-                        json_content = json_parts[1].split("```")[0].strip()
-                        structured_data = json.loads(json_content)
-                        
-                        if "bugs" in structured_data:
-                            for bug in structured_data["bugs"]:
-                                bugs_detected.append(
-                                    BugInfo(
-                                        line=bug.get("line", 0),
-                                        description=bug.get("description", ""),
-                                        severity=bug.get("severity", "medium"),
-                                        suggestion=bug.get("suggestion")
-                                    )
-                                )
-                        
-                        if "suggestions" in structured_data:
-                            for suggestion in structured_data["suggestions"]:
-                                suggestions.append(
-                                    Suggestion(
-                                        description=suggestion.get("description", ""),
-                                        code_snippet=suggestion.get("code_snippet")
-                                    )
-                                )
-            except Exception as parse_error:
-                logger.warning(f"Error parsing structured data: {parse_error}")
-                pass
+            bugs_detected, suggestions = findings or ([], [])
             
             request_id = str(uuid.uuid4())
             
@@ -79,9 +228,200 @@ class LLMService:
                 review=review_text,
                 bugs_detected=bugs_detected,
                 suggestions=suggestions,
-                request_id=request_id
+                request_id=request_id,
+                tier=tier
             )
             
         except Exception as e:
             logger.error(f"Error in code review: {e}")
             raise
+    
+    async def _review_chunk(
+        self,
+        chunk: CodeChunk,
+        total_lines: int,
+        language: str,
+        context: Optional[str],
+        history: Optional[str],
+        deadline: Optional[float],
+        mode: str,
+        tier: str
+    ) -> LLMReviewResult:
+        chunk_context = CHUNK_CONTEXT.format(
+            start_line=chunk.start_line,
+            end_line=chunk.end_line,
+            total_lines=total_lines,
+            overlap=chunk.overlap
+        )
+        if context:
+            chunk_context = f"{context}\n\n{chunk_context}"
+        
+        start_time = time.time()
+        result = await self._review_single(chunk.source, language, chunk_context, history, deadline, mode, tier)
+        CHUNK_REVIEW_LATENCY.observe(time.time() - start_time)
+        
+        # Findings in the overlap belong to the previous chunk.
+        bugs_detected = [bug for bug in result.bugs_detected if not 1 <= bug.line <= chunk.overlap]
+        return result.model_copy(update={"bugs_detected": bugs_detected})
+    
+    async def _review_chunked(
+        self,
+        code: str,
+        language: str,
+        context: Optional[str],
+        history: Optional[str],
+        deadline: Optional[float],
+        mode: str,
+        tier: str
+    ) -> LLMReviewResult:
+        chunks = split_chunks(code, language, settings.REVIEW_CHUNK_TOKENS, settings.REVIEW_CHUNK_OVERLAP_LINES)
+        if len(chunks) <= 1:
+            return await self._review_single(code, language, context, history, deadline, mode, tier)
+        
+        REVIEW_CHUNKS.observe(len(chunks))
+        total_lines = len(code.splitlines())
+        results = await gather_bounded([
+            partial(self._review_chunk, chunk, total_lines, language, context, history, deadline, mode, tier)
+            for chunk in chunks
+        ], settings.REVIEW_FANOUT_CONCURRENCY)
+        merged = self._merge_unit_reviews(list(zip(chunks, results)))
+        
+        if mode == "structured":
+            return merged.model_copy(update={"review": ""})
+        if not settings.REVIEW_CHUNK_REDUCE:
+            return merged
+        
+        try:
+            summary = await self.generate(
+                CHUNK_REDUCE_PROMPT.format(language=language, chunk_count=len(chunks), sections=merged.review),
+                deadline,
+                tier=tier
+            )
+        except Exception as e:
+            logger.warning(f"Skipping summary of chunked review: {e}")
+            return merged
+        
+        return merged.model_copy(update={"review": f"## Summary\n\n{summary.strip()}\n\n{merged.review}"})
+    
+    async def review_code_stream(
+        self,
+        code: str,
+        language: str,
+        context: Optional[str] = None,
+        history: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> AsyncIterator[Union[str, LLMReviewResult]]:
+        # Yields text chunks as the backend produces them, then one
+        # LLMReviewResult parsed from the complete text. Only opening the
+        # stream is retried; a retry after chunks were sent would repeat them.
+        if estimate_tokens(code) > settings.REVIEW_CHUNK_TOKENS:
+            # Chunked reviews are assembled from several generations, so the
+            # merged text is sent as a single chunk.
+            result = await self.review_code(code, language, context, history, deadline)
+            yield result.review
+            yield result
+            return
+        
+        prompt = self._build_prompt(code, language, context, history)
+        tier = select_tier(code, language)
+        chunks = []
+        
+        # The admission slot is held until the stream is drained.
+        async with self.admission.slot(INTERACTIVE, deadline):
+            start_time = time.time()
+            response = await self.retry_policy.call(
+                lambda: self.backend.stream(prompt, tier_model(tier)),
+                self.breaker,
+                deadline
+            )
+            try:
+                async for text in response:
+                    chunks.append(text)
+                    yield text
+            except self.backend.transient_errors:
+                self.breaker.record_failure()
+                raise
+            review_text = "".join(chunks)
+            self._observe_tier(tier, prompt, review_text, start_time)
+        
+        # A streamed review cannot be escalated once its text has been sent.
+        bugs_detected, suggestions = self._parse_review(review_text) or ([], [])
+        
+        yield LLMReviewResult(
+            review=review_text,
+            bugs_detected=bugs_detected,
+            suggestions=suggestions,
+            request_id=str(uuid.uuid4()),
+            tier=tier
+        )
+    
+    async def review_code_incremental(
+        self,
+        code: str,
+        language: str,
+        context: Optional[str],
+        unit_cache,
+        deadline: Optional[float] = None,
+        mode: str = "full"
+    ) -> LLMReviewResult:
+        units = [unit for unit in split_units(code, language) if unit.source.strip()]
+        if len(units) <= 1:
+            return await self.review_code(code, language, context, deadline=deadline, mode=mode)
+        
+        unit_context = f"{context}\n\n{INCREMENTAL_UNIT_CONTEXT}" if context else INCREMENTAL_UNIT_CONTEXT
+        keys = [
+            review_fingerprint(unit.source, language, unit_context, mode, tier_model(select_tier(unit.source, language, mode)))
+            for unit in units
+        ]
+        
+        cached = await unit_cache.get_unit_reviews(keys)
+        pending = {key: unit for key, unit in zip(keys, units) if key not in cached}
+        INCREMENTAL_UNITS.labels(result="cached").inc(len(units) - len(pending))
+        INCREMENTAL_UNITS.labels(result="reviewed").inc(len(pending))
+        
+        # Bounded so that a large first review cannot flood the admission
+        # queue.
+        fresh = await gather_bounded([
+            partial(self.review_code, unit.source, language, unit_context, deadline=deadline, mode=mode)
+            for unit in pending.values()
+        ], settings.REVIEW_FANOUT_CONCURRENCY)
+        fresh_reviews = dict(zip(pending.keys(), fresh))
+        await unit_cache.cache_unit_reviews(fresh_reviews)
+        
+        reviews = {**cached, **fresh_reviews}
+        return self._merge_unit_reviews([(unit, reviews[key]) for key, unit in zip(keys, units)])
+    
+    def _merge_unit_reviews(self, results: List[Tuple[Union[CodeUnit, CodeChunk], LLMReviewResult]]) -> LLMReviewResult:
+        sections = []
+        bugs_detected = []
+        suggestions = []
+        seen_bugs = set()
+        seen_suggestions = set()
+        
+        for unit, result in results:
+            prose = result.review.split("```json")[0].strip()
+            if prose:
+                sections.append(f"### Lines {unit.start_line}-{unit.end_line}\n\n{prose}")
+            
+            # Unit reviews are cached with line numbers relative to the unit.
+            unit_length = unit.end_line - unit.start_line + 1
+            for bug in result.bugs_detected:
+                line = (bug.line if 1 <= bug.line <= unit_length else 1) + unit.start_line - 1
+                if (line, bug.description) not in seen_bugs:
+                    seen_bugs.add((line, bug.description))
+                    bugs_detected.append(bug.model_copy(update={"line": line}))
+            
+            for suggestion in result.suggestions:
+                if suggestion.description not in seen_suggestions:
+                    seen_suggestions.add(suggestion.description)
+                    suggestions.append(suggestion)
+        
+        # A merged review is attributed to the strongest tier that took part.
+        tiers = [result.tier for _, result in results if result.tier]
+        return LLMReviewResult(
+            review="\n\n".join(sections),
+            bugs_detected=bugs_detected,
+            suggestions=suggestions,
+            request_id=str(uuid.uuid4()),
+            tier=max(tiers, key=TIERS.index) if tiers else None
+        )
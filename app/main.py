@@ -1,15 +1,25 @@
-from fastapi import FastAPI, HTTPException, Request, BackgroundTasks, Response
+from fastapi import FastAPI, HTTPException, Request, BackgroundTasks, Response, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
 import hashlib
 import hmac
 import json
+import logging
 from datetime import datetime
 import time
-from prometheus_client import Counter, Gauge, Histogram, Info, generate_latest
+import math
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+from prometheus_client import generate_latest
 from prometheus_client import CONTENT_TYPE_LATEST
 from .models import (
     CodeReviewRequest, 
     CodeReviewResponse, 
+    LLMReviewResult,
+    BatchReviewRequest,
+    BatchReviewItem,
+    BatchReviewResponse,
     GithubWebhookPayload,
     RateLimitExceededError,
     FeedbackRequest
@@ -19,11 +29,115 @@ from .github_service import GitHubService
 from .config import settings
 from .rate_limiter import RateLimiter
 from .cache_manager import CacheManager
+from .redis_pool import RedisPool
+from .single_flight import SingleFlight
+from .fingerprint import review_fingerprint, source_digest, PROMPT_VERSION
+from .model_routing import select_tier, tier_model
+from .conversation import build_history_context, make_turn
+from .resilience import CircuitOpenError, DeadlineExceededError, remaining_time
+from .admission import AdmissionRejectedError
+from .metrics import (
+    REVIEW_REQUESTS,
+    REVIEW_LATENCY,
+    BUGS_DETECTED,
+    SUGGESTIONS_MADE,
+    WEBHOOK_REQUESTS,
+    FEEDBACK_SUBMISSIONS,
+    CACHE_HITS,
+    CACHE_MISSES,
+    RATE_LIMIT_EXCEEDED,
+    ACTIVE_REVIEWS,
+    COALESCED_REVIEWS,
+    REVIEW_TTFT,
+    BATCH_REVIEW_ITEMS,
+    STARTUP_SECONDS,
+    DEPENDENCY_UP
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+redis_pool: Optional[RedisPool] = None
+llm_service: Optional[LLMService] = None
+github_service: Optional[GitHubService] = None
+cache_manager: Optional[CacheManager] = None
+rate_limiter: Optional[RateLimiter] = None
+review_flight = SingleFlight()
+
+def init_services() -> None:
+    # Services that are already set (e.g. patched in tests) are kept.
+    global redis_pool, llm_service, github_service, cache_manager, rate_limiter
+    
+    if redis_pool is None:
+        redis_pool = RedisPool()
+    if llm_service is None:
+        llm_service = LLMService()
+    if github_service is None:
+        github_service = GitHubService(redis_pool)
+    if cache_manager is None:
+        cache_manager = CacheManager(redis_pool)
+    if rate_limiter is None:
+        rate_limiter = RateLimiter(
+            redis_pool=redis_pool,
+            rate_limit=settings.RATE_LIMIT,
+            window_minutes=settings.RATE_LIMIT_WINDOW,
+            algorithm=settings.RATE_LIMIT_ALGORITHM,
+            burst=settings.RATE_LIMIT_BURST,
+            route_limits={
+                "review": settings.RATE_LIMIT_REVIEW,
+                "feedback": settings.RATE_LIMIT_FEEDBACK
+            },
+            mode=settings.RATE_LIMIT_MODE,
+            lease_fraction=settings.RATE_LIMIT_LEASE_FRACTION,
+            lease_ttl=settings.RATE_LIMIT_LEASE_TTL,
+            local_share=settings.RATE_LIMIT_LOCAL_SHARE
+        )
+
+async def _check_dependency(name: str, check) -> bool:
+    try:
+        healthy = await asyncio.wait_for(check, timeout=settings.STARTUP_CHECK_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"{name} health check failed: {e}")
+        healthy = False
+    DEPENDENCY_UP.labels(dependency=name).set(1 if healthy else 0)
+    return healthy
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    init_services()
+    
+    redis_ok, llm_ok = await asyncio.gather(
+        _check_dependency("redis", redis_pool.ping()),
+        _check_dependency("llm", llm_service.backend.ping())
+    )
+    if redis_ok:
+        logger.info("Successfully connected to Redis")
+    else:
+        logger.warning("Could not connect to Redis - caching and rate limiting degraded until it recovers")
+    if not llm_ok:
+        logger.warning(f"LLM backend {llm_service.backend.name} did not answer its health check")
+    
+    background = [
+        asyncio.create_task(cache_manager.listen_for_invalidations()),
+        asyncio.create_task(cache_manager.consume_feedback())
+    ]
+    STARTUP_SECONDS.set(time.perf_counter() - started)
+    app.state.ready = True
+    logger.info(f"Startup completed in {time.perf_counter() - started:.3f}s")
+    yield
+    app.state.ready = False
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    await github_service.close()
+    await redis_pool.close()
 
 app = FastAPI(
     title="CodeSage",
     description="An API for automated code review and bug prediction",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -34,50 +148,168 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-llm_service = LLMService()
-github_service = GitHubService()
-cache_manager = CacheManager()
-rate_limiter = RateLimiter(
-    redis_host=settings.REDIS_HOST,
-    redis_port=settings.REDIS_PORT,
-    rate_limit=settings.RATE_LIMIT,
-    window_minutes=settings.RATE_LIMIT_WINDOW
-)
-
-REVIEW_REQUESTS = Counter('codesage_review_requests_total', 'Total code review requests', ['language'])
-REVIEW_LATENCY = Histogram('codesage_review_latency_seconds', 'Latency of code review requests', 
-                          buckets=[0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0])
-BUGS_DETECTED = Counter('codesage_bugs_detected_total', 'Total bugs detected', ['severity'])
-SUGGESTIONS_MADE = Counter('codesage_suggestions_total', 'Total improvement suggestions made')
-WEBHOOK_REQUESTS = Counter('codesage_github_webhook_requests_total', 'Total GitHub webhook requests', ['event_type'])
-FEEDBACK_SUBMISSIONS = Counter('codesage_feedback_submissions_total', 'Total feedback submissions', ['helpful'])
-CACHE_HITS = Counter('codesage_cache_hits_total', 'Total cache hits')
-CACHE_MISSES = Counter('codesage_cache_misses_total', 'Total cache misses')
-RATE_LIMIT_EXCEEDED = Counter('codesage_rate_limit_exceeded_total', 'Total rate limit exceeded events')
-API_INFO = Info('codesage_api', 'Information about the CodeSage API')
-API_INFO.info({'version': '1.0.0', 'author': 'CodeSage Team'})
-ACTIVE_REVIEWS = Gauge('codesage_active_reviews', 'Number of reviews currently being processed')
+app.state.ready = False
 
 @app.get("/")
 async def root():
     return {"status": "online", "message": "CodeSage API is running"}
 
+@app.get("/ready")
+async def ready():
+    if not app.state.ready:
+        raise HTTPException(status_code=503, detail="Service is starting up")
+    
+    # Redis outages degrade caching and rate limiting but do not stop
+    # reviews, so they are reported without failing readiness.
+    redis_ok = await redis_pool.ping()
+    DEPENDENCY_UP.labels(dependency="redis").set(1 if redis_ok else 0)
+    return {
+        "status": "ready",
+        "checks": {
+            "redis": "ok" if redis_ok else "unavailable",
+            "llm": llm_service.breaker.state
+        }
+    }
+
+async def _enforce_rate_limit(user_id: str, route: str, response: Response, cost: int = 1) -> Dict[str, str]:
+    result = await rate_limiter.check_rate_limit(user_id, route, cost)
+    if not result.allowed:
+        RATE_LIMIT_EXCEEDED.inc()
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=result.headers())
+    response.headers.update(result.headers())
+    return result.headers()
+
+async def _prepare_review(request: CodeReviewRequest) -> Tuple[str, str, Optional[str]]:
+    # Prior turns change what the model should report, so they are part of
+    # the cache key as well as the prompt. Incremental reviews are built from
+    # per-unit prompts without history, so it stays out of their key.
+    history = None
+    if request.session_id and not request.incremental:
+        turns = await cache_manager.get_conversation_history(request.session_id)
+        if turns:
+            history = build_history_context(turns, settings.HISTORY_TOKEN_BUDGET)
+    
+    cache_key = review_fingerprint(
+        request.code,
+        request.language,
+        request.context,
+        "incremental" if request.incremental else "whole",
+        request.mode,
+        tier_model(select_tier(request.code, request.language, request.mode)),
+        history or ""
+    )
+    return cache_key, source_digest(request.code), history
+
+def _review_meta(request: CodeReviewRequest, review_result: LLMReviewResult) -> Dict[str, str]:
+    # The tier that produced the review, which differs from the selected one
+    # after an escalation.
+    tier = review_result.tier or select_tier(request.code, request.language, request.mode)
+    return {
+        "language": request.language.strip().lower(),
+        "model": tier_model(tier),
+        "tier": tier,
+        "prompt_version": PROMPT_VERSION,
+        "mode": request.mode
+    }
+
+def _review_error(e: Exception) -> HTTPException:
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(
+            status_code=503,
+            detail="Review model is temporarily unavailable",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
+    if isinstance(e, AdmissionRejectedError):
+        return HTTPException(
+            status_code=503,
+            detail="Review capacity is exhausted, try again shortly",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
+    if isinstance(e, DeadlineExceededError):
+        return HTTPException(status_code=504, detail=str(e))
+    return HTTPException(status_code=500, detail=str(e))
+
+def _build_response(review_result: LLMReviewResult) -> CodeReviewResponse:
+    # Track bugs by severity
+    for bug in review_result.bugs_detected:
+        BUGS_DETECTED.labels(severity=bug.severity.lower()).inc()
+        
+    # Track suggestions
+    SUGGESTIONS_MADE.inc(len(review_result.suggestions))
+    
+    return CodeReviewResponse(
+        review=review_result.review,
+        bugs_detected=review_result.bugs_detected,
+        suggestions=review_result.suggestions,
+        request_id=review_result.request_id,
+        timestamp=datetime.now().isoformat()
+    )
+
+async def _review_and_cache(
+    cache_key: str,
+    source: str,
+    request: CodeReviewRequest,
+    history: Optional[str] = None,
+    deadline: Optional[float] = None
+) -> CodeReviewResponse:
+    lock_token = await cache_manager.acquire_review_lock(cache_key)
+    if lock_token is None:
+        wait_timeout = settings.SINGLE_FLIGHT_WAIT_TIMEOUT
+        if deadline is not None:
+            wait_timeout = max(0.0, min(wait_timeout, remaining_time(deadline)))
+        handed_off = await cache_manager.wait_for_review(cache_key, wait_timeout)
+        if handed_off:
+            COALESCED_REVIEWS.labels(scope="replica").inc()
+            return handed_off
+    
+    try:
+        if request.incremental:
+            review_result = await llm_service.review_code_incremental(
+                code=request.code,
+                language=request.language,
+                context=request.context,
+                unit_cache=cache_manager,
+                deadline=deadline,
+                mode=request.mode
+            )
+        else:
+            review_result = await llm_service.review_code(
+                code=request.code,
+                language=request.language,
+                context=request.context,
+                history=history,
+                deadline=deadline,
+                mode=request.mode
+            )
+        
+        response = _build_response(review_result)
+        
+        # Written before the lock is released so that waiters on other
+        # replicas can pick the result up.
+        await cache_manager.cache_review(cache_key, response, source, meta=_review_meta(request, review_result))
+        return response
+    finally:
+        if lock_token:
+            await cache_manager.release_review_lock(cache_key, lock_token)
+
 @app.post("/review", response_model=CodeReviewResponse)
 async def review_code(
     request: CodeReviewRequest,
+    response: Response,
     background_tasks: BackgroundTasks,
     user_id: str = "anonymous"
 ):
-    if not await rate_limiter.check_rate_limit(user_id):
-        RATE_LIMIT_EXCEEDED.inc()
-        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+    await _enforce_rate_limit(user_id, "review", response)
     
     REVIEW_REQUESTS.labels(language=request.language).inc()
     start_time = time.time()
+    deadline = time.monotonic() + settings.REVIEW_DEADLINE_SECONDS
     ACTIVE_REVIEWS.inc()
     
-    cache_key = hashlib.md5(f"{request.code}:{request.language}".encode()).hexdigest()
-    cached_response = await cache_manager.get_cached_review(cache_key)
+    cache_key, source, history = await _prepare_review(request)
+    cached_response = await cache_manager.get_cached_review(cache_key, source)
     if cached_response:
         CACHE_HITS.inc()
         REVIEW_LATENCY.observe(time.time() - start_time)
@@ -87,40 +319,180 @@ async def review_code(
     CACHE_MISSES.inc()
     
     try:
-        review_result = await llm_service.review_code(
-            code=request.code,
-            language=request.language,
-            context=request.context
-        )
-        
-        # Track bugs by severity
-        for bug in review_result.bugs_detected:
-            BUGS_DETECTED.labels(severity=bug.severity.lower()).inc()
-            
-        # Track suggestions
-        SUGGESTIONS_MADE.inc(len(review_result.suggestions))
-        
-        response = CodeReviewResponse(
-            review=review_result.review,
-            bugs_detected=review_result.bugs_detected,
-            suggestions=review_result.suggestions,
-            request_id=review_result.request_id,
-            timestamp=datetime.now().isoformat()
-        )
-        
-        background_tasks.add_task(
-            cache_manager.cache_review,
+        review_response, coalesced = await review_flight.do(
             cache_key,
-            response
+            lambda: _review_and_cache(cache_key, source, request, history, deadline)
         )
+        if coalesced:
+            COALESCED_REVIEWS.labels(scope="process").inc()
+        elif request.session_id:
+            background_tasks.add_task(
+                cache_manager.add_to_conversation_history,
+                request.session_id,
+                make_turn(request.language, review_response)
+            )
         
         REVIEW_LATENCY.observe(time.time() - start_time)
         ACTIVE_REVIEWS.dec()
-        return response
+        return review_response
     
     except Exception as e:
         ACTIVE_REVIEWS.dec()
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _review_error(e)
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/review/stream")
+async def review_code_stream(
+    request: CodeReviewRequest,
+    response: Response,
+    user_id: str = "anonymous"
+):
+    headers = await _enforce_rate_limit(user_id, "review", response)
+    REVIEW_REQUESTS.labels(language=request.language).inc()
+    
+    async def events():
+        start_time = time.time()
+        deadline = time.monotonic() + settings.REVIEW_DEADLINE_SECONDS
+        ACTIVE_REVIEWS.inc()
+        try:
+            cache_key, source, history = await _prepare_review(request)
+            cached_response = await cache_manager.get_cached_review(cache_key, source)
+            if cached_response:
+                CACHE_HITS.inc()
+                yield _sse("result", cached_response.model_dump())
+                return
+            
+            CACHE_MISSES.inc()
+            if request.incremental or request.mode == "structured":
+                # Incremental reviews are merged from per-unit results and
+                # structured reviews have no prose, so there is nothing to stream.
+                review_response, _ = await review_flight.do(
+                    cache_key,
+                    lambda: _review_and_cache(cache_key, source, request, history, deadline)
+                )
+                yield _sse("result", review_response.model_dump())
+                return
+            
+            first_chunk = True
+            async for item in llm_service.review_code_stream(
+                code=request.code,
+                language=request.language,
+                context=request.context,
+                history=history,
+                deadline=deadline
+            ):
+                if isinstance(item, str):
+                    if first_chunk:
+                        REVIEW_TTFT.observe(time.time() - start_time)
+                        first_chunk = False
+                    yield _sse("chunk", {"text": item})
+                    continue
+                
+                review_response = _build_response(item)
+                await cache_manager.cache_review(cache_key, review_response, source, meta=_review_meta(request, item))
+                if request.session_id:
+                    await cache_manager.add_to_conversation_history(
+                        request.session_id,
+                        make_turn(request.language, review_response)
+                    )
+                yield _sse("result", review_response.model_dump())
+        except Exception as e:
+            logger.error(f"Error in streaming review: {e}")
+            error = _review_error(e)
+            yield _sse("error", {"status": error.status_code, "detail": error.detail})
+        finally:
+            REVIEW_LATENCY.observe(time.time() - start_time)
+            ACTIVE_REVIEWS.dec()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={**headers, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/review/batch", response_model=BatchReviewResponse)
+async def review_batch(
+    batch: BatchReviewRequest,
+    response: Response,
+    user_id: str = "anonymous"
+):
+    if len(batch.requests) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {settings.BATCH_MAX_ITEMS} reviews")
+    
+    BATCH_REVIEW_ITEMS.observe(len(batch.requests))
+    for request in batch.requests:
+        REVIEW_REQUESTS.labels(language=request.language).inc()
+    
+    prepared = await asyncio.gather(*[_prepare_review(request) for request in batch.requests])
+    cached = await cache_manager.get_cached_reviews([(key, source) for key, source, _ in prepared])
+    
+    # Identical snippets in one batch are reviewed once.
+    pending: Dict[str, List[int]] = {}
+    for index, (key, _, _) in enumerate(prepared):
+        if key in cached:
+            CACHE_HITS.inc()
+        else:
+            CACHE_MISSES.inc()
+            pending.setdefault(key, []).append(index)
+    
+    headers = {}
+    if pending:
+        # Only the reviews that actually reach the LLM count, and they share
+        # the single-review budget so batching cannot bypass it.
+        headers = await _enforce_rate_limit(user_id, "review", response, cost=len(pending))
+    
+    semaphore = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+    deadline = time.monotonic() + settings.REVIEW_DEADLINE_SECONDS
+    
+    async def review_pending(key: str, indices: List[int]) -> List[BatchReviewItem]:
+        request = batch.requests[indices[0]]
+        _, source, history = prepared[indices[0]]
+        try:
+            async with semaphore:
+                ACTIVE_REVIEWS.inc()
+                try:
+                    review_response, coalesced = await review_flight.do(
+                        key,
+                        lambda: _review_and_cache(key, source, request, history, deadline)
+                    )
+                finally:
+                    ACTIVE_REVIEWS.dec()
+            if coalesced:
+                COALESCED_REVIEWS.labels(scope="process").inc()
+            for index in indices:
+                session_id = batch.requests[index].session_id
+                if session_id:
+                    await cache_manager.add_to_conversation_history(
+                        session_id,
+                        make_turn(batch.requests[index].language, review_response)
+                    )
+            return [BatchReviewItem(index=index, status="ok", response=review_response) for index in indices]
+        except Exception as e:
+            logger.error(f"Error in batch review item: {e}")
+            detail = _review_error(e).detail
+            return [BatchReviewItem(index=index, status="error", error=detail) for index in indices]
+    
+    hits = [
+        BatchReviewItem(index=index, status="ok", cached=True, response=cached[key])
+        for index, (key, _, _) in enumerate(prepared)
+        if key in cached
+    ]
+    tasks = [review_pending(key, indices) for key, indices in pending.items()]
+    
+    if batch.stream:
+        async def items():
+            for item in hits:
+                yield item.model_dump_json() + "\n"
+            for finished in asyncio.as_completed(tasks):
+                for item in await finished:
+                    yield item.model_dump_json() + "\n"
+        
+        return StreamingResponse(items(), media_type="application/x-ndjson", headers=headers)
+    
+    results = hits + [item for items in await asyncio.gather(*tasks) for item in items]
+    return BatchReviewResponse(results=sorted(results, key=lambda item: item.index))
 
 @app.post("/webhook/github")
 async def github_webhook(request: Request, background_tasks: BackgroundTasks):
@@ -154,13 +526,44 @@ async def github_webhook(request: Request, background_tasks: BackgroundTasks):
     return {"status": "processing"}
 
 @app.post("/feedback")
-async def submit_feedback(feedback: FeedbackRequest):
+async def submit_feedback(feedback: FeedbackRequest, response: Response):
+    await _enforce_rate_limit(feedback.user_id or "anonymous", "feedback", response)
     FEEDBACK_SUBMISSIONS.labels(helpful="yes" if feedback.helpful else "no").inc()
     
     await cache_manager.store_feedback(feedback)
     
     return {"status": "success", "message": "Feedback submitted successfully"}
 
+@app.get("/feedback/stats")
+async def feedback_stats(days: int = Query(7, ge=1, le=settings.FEEDBACK_STATS_RETENTION_DAYS)):
+    stats = await cache_manager.get_feedback_stats(days)
+    if stats is None:
+        raise HTTPException(status_code=503, detail="Feedback statistics are unavailable")
+    
+    def with_rate(counters):
+        rate = counters["helpful"] / counters["total"] if counters["total"] else None
+        return {**counters, "helpful_rate": rate}
+    
+    overall = stats.get("all", {}).get("all", {"total": 0, "helpful": 0})
+    return {
+        "days": days,
+        **with_rate(overall),
+        "by_language": {k: with_rate(v) for k, v in stats.get("language", {}).items()},
+        "by_model": {k: with_rate(v) for k, v in stats.get("model", {}).items()},
+        "by_prompt_version": {k: with_rate(v) for k, v in stats.get("prompt_version", {}).items()}
+    }
+
+@app.post("/cache/purge")
+async def purge_cached_review(request: CodeReviewRequest, x_admin_token: str = Header("")):
+    # Drops the cached review for this exact request from Redis and from the
+    # L1 cache of every replica, e.g. after a review turned out to be wrong.
+    if not settings.CACHE_ADMIN_TOKEN or not hmac.compare_digest(x_admin_token, settings.CACHE_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    
+    cache_key, _, _ = await _prepare_review(request)
+    propagated = await cache_manager.invalidate_review(cache_key)
+    return {"status": "purged", "key": cache_key, "propagated": propagated}
+
 @app.get("/metrics")
 async def metrics():
     return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
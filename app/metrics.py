@@ -0,0 +1,68 @@
+from prometheus_client import Counter, Gauge, Histogram, Info
+
+REVIEW_REQUESTS = Counter('codesage_review_requests_total', 'Total code review requests', ['language'])
+REVIEW_LATENCY = Histogram('codesage_review_latency_seconds', 'Latency of code review requests', 
+                          buckets=[0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0])
+REVIEW_TTFT = Histogram('codesage_review_time_to_first_token_seconds', 'Time from a streaming review request to its first generated chunk',
+                        buckets=[0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0])
+BATCH_REVIEW_ITEMS = Histogram('codesage_batch_review_items', 'Number of snippets per batch review request',
+                               buckets=[1, 2, 5, 10, 20, 50, 100])
+BUGS_DETECTED = Counter('codesage_bugs_detected_total', 'Total bugs detected', ['severity'])
+SUGGESTIONS_MADE = Counter('codesage_suggestions_total', 'Total improvement suggestions made')
+WEBHOOK_REQUESTS = Counter('codesage_github_webhook_requests_total', 'Total GitHub webhook requests', ['event_type'])
+FEEDBACK_SUBMISSIONS = Counter('codesage_feedback_submissions_total', 'Total feedback submissions', ['helpful'])
+CACHE_HITS = Counter('codesage_cache_hits_total', 'Total cache hits')
+CACHE_MISSES = Counter('codesage_cache_misses_total', 'Total cache misses')
+L1_CACHE_HITS = Counter('codesage_l1_cache_hits_total', 'Review cache hits served from the in-process L1 cache')
+L1_CACHE_MISSES = Counter('codesage_l1_cache_misses_total', 'Review cache misses in the in-process L1 cache')
+L2_CACHE_HITS = Counter('codesage_l2_cache_hits_total', 'Review cache hits served from Redis (L2)')
+L2_CACHE_MISSES = Counter('codesage_l2_cache_misses_total', 'Review cache misses in Redis (L2)')
+L1_CACHE_ENTRIES = Gauge('codesage_l1_cache_entries', 'Number of reviews held in the in-process L1 cache')
+L1_CACHE_BYTES = Gauge('codesage_l1_cache_bytes', 'Approximate size in bytes of the in-process L1 cache')
+CACHE_FINGERPRINT_HITS = Counter('codesage_cache_fingerprint_hits_total', 'Review cache hits by whether the submitted code matched the cached source exactly or only after normalization', ['match'])
+CACHE_ENTRY_BYTES = Histogram('codesage_cache_entry_bytes', 'Encoded size of entries written to Redis', ['keyspace'],
+                              buckets=[256, 1024, 4096, 16384, 65536, 262144, 1048576])
+CACHE_COMPRESSION_RATIO = Gauge('codesage_cache_compression_ratio', 'Serialized bytes divided by stored bytes for entries written since startup', ['keyspace'])
+CACHE_INVALIDATIONS = Counter('codesage_cache_invalidations_total', 'L1 cache invalidations', ['source'])
+COALESCED_REVIEWS = Counter('codesage_coalesced_reviews_total', 'Review requests served by waiting on an identical in-flight review', ['scope'])
+INCREMENTAL_UNITS = Counter('codesage_incremental_units_total', 'Code units handled by incremental reviews', ['result'])
+REVIEW_CHUNKS = Histogram('codesage_review_chunks', 'Chunks per review of an oversized submission',
+                          buckets=[2, 3, 4, 6, 8, 12, 16, 32])
+CHUNK_REVIEW_LATENCY = Histogram('codesage_chunk_review_latency_seconds', 'Latency of reviewing one chunk of an oversized submission',
+                                 buckets=[0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0])
+LLM_TIER_REQUESTS = Counter('codesage_llm_tier_requests_total', 'LLM calls by model tier', ['tier'])
+LLM_TIER_LATENCY = Histogram('codesage_llm_tier_latency_seconds', 'LLM call latency by model tier, excluding queueing', ['tier'],
+                             buckets=[0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0])
+LLM_TIER_TOKENS = Counter('codesage_llm_tier_tokens_total', 'Estimated LLM tokens by model tier', ['tier', 'direction'])
+MODEL_ESCALATIONS = Counter('codesage_model_escalations_total', 'Reviews re-run on a stronger model after unparseable output', ['from_tier', 'to_tier'])
+LLM_RETRIES = Counter('codesage_llm_retries_total', 'Retried LLM calls by error type', ['error'])
+LLM_CIRCUIT_STATE = Gauge('codesage_llm_circuit_state', 'LLM circuit breaker state (0=closed, 1=half-open, 2=open)', ['name'])
+LLM_CIRCUIT_REJECTIONS = Counter('codesage_llm_circuit_rejections_total', 'LLM calls rejected because the circuit was open', ['name'])
+LLM_IN_FLIGHT = Gauge('codesage_llm_in_flight', 'LLM calls currently holding an admission slot', ['lane'])
+LLM_QUEUE_DEPTH = Gauge('codesage_llm_queue_depth', 'LLM calls waiting for an admission slot', ['lane'])
+LLM_QUEUE_WAIT = Histogram('codesage_llm_queue_wait_seconds', 'Time LLM calls spent waiting for an admission slot', ['lane'],
+                           buckets=[0.01, 0.05, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0])
+LLM_CALL_LATENCY = Histogram('codesage_llm_call_latency_seconds', 'Time LLM calls held an admission slot', ['lane'],
+                             buckets=[0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0])
+LLM_ADMISSION_REJECTIONS = Counter('codesage_llm_admission_rejections_total', 'LLM calls shed by admission control', ['lane', 'reason'])
+RATE_LIMIT_EXCEEDED = Counter('codesage_rate_limit_exceeded_total', 'Total rate limit exceeded events')
+RATE_LIMIT_DECISIONS = Counter('codesage_rate_limit_decisions_total', 'Rate limit decisions by where they were made', ['source'])
+STARTUP_SECONDS = Gauge('codesage_startup_seconds', 'Time spent in application startup')
+DEPENDENCY_UP = Gauge('codesage_dependency_up', 'Whether a dependency answered its last health check', ['dependency'])
+GITHUB_REQUESTS = Counter('codesage_github_requests_total', 'GitHub API requests by endpoint and status', ['endpoint', 'status'])
+GITHUB_REQUEST_LATENCY = Histogram('codesage_github_request_latency_seconds', 'GitHub API request latency by endpoint', ['endpoint'],
+                                   buckets=[0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0])
+GITHUB_CONNECTIONS = Counter('codesage_github_connections_total', 'Connections used for GitHub API requests by whether they were reused', ['endpoint', 'reused'])
+GITHUB_CACHE_REQUESTS = Counter('codesage_github_cache_requests_total', 'Cacheable GitHub API requests by whether a conditional request was answered with 304 (hit) or a full body (miss)', ['endpoint', 'result'])
+GITHUB_RATE_LIMIT_REMAINING = Gauge('codesage_github_rate_limit_remaining', 'Requests left in the current GitHub API rate limit window', ['resource'])
+PR_REVIEW_STAGE_SECONDS = Histogram('codesage_pr_review_stage_seconds', 'Time spent in each stage of a pull request review', ['stage'],
+                                    buckets=[0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0])
+PR_REVIEWS_SUPERSEDED = Counter('codesage_pr_reviews_superseded_total', 'Pull request reviews cancelled because a newer push arrived')
+PR_PROMPT_TOKENS = Histogram('codesage_pr_prompt_tokens', 'Estimated tokens in pull request review prompts',
+                             buckets=[500, 1000, 2000, 4000, 8000, 16000, 32000, 64000])
+PR_FILES_LISTED = Histogram('codesage_pr_files_listed', 'Files listed per pull request',
+                            buckets=[1, 5, 10, 30, 100, 300, 1000, 3000])
+PR_FILES_FILTERED = Counter('codesage_pr_files_filtered_total', 'Pull request files skipped before review by reason', ['reason'])
+API_INFO = Info('codesage_api', 'Information about the CodeSage API')
+API_INFO.info({'version': '1.0.0', 'author': 'CodeSage Team'})
+ACTIVE_REVIEWS = Gauge('codesage_active_reviews', 'Number of reviews currently being processed')
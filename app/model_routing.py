@@ -0,0 +1,32 @@
+from typing import Optional
+from .config import settings
+from .tokens import estimate_tokens
+
+LIGHT = "light"
+STANDARD = "standard"
+STRONG = "strong"
+TIERS = [LIGHT, STANDARD, STRONG]
+
+def tier_model(tier: str) -> str:
+    return {
+        LIGHT: settings.GEMINI_LIGHT_MODEL,
+        STANDARD: settings.GEMINI_MODEL,
+        STRONG: settings.GEMINI_STRONG_MODEL
+    }[tier]
+
+def select_tier(code: str, language: str, mode: str = "full") -> str:
+    tokens = estimate_tokens(code)
+    if tokens >= settings.MODEL_STRONG_MIN_TOKENS:
+        return STRONG
+    
+    # Structured output is short, so the light model can take larger inputs
+    # there than for a full prose review.
+    light_limit = settings.MODEL_LIGHT_MAX_TOKENS * (2 if mode == "structured" else 1)
+    light_languages = {name.strip().lower() for name in settings.MODEL_LIGHT_LANGUAGES.split(",") if name.strip()}
+    if tokens <= light_limit and language.strip().lower() in light_languages:
+        return LIGHT
+    return STANDARD
+
+def next_tier(tier: str) -> Optional[str]:
+    index = TIERS.index(tier)
+    return TIERS[index + 1] if index + 1 < len(TIERS) else None
@@ -1,10 +1,13 @@
 from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Literal
 
 class CodeReviewRequest(BaseModel):
     code: str
     language: str
     context: Optional[str] = None
+    incremental: bool = False
+    session_id: Optional[str] = None
+    mode: Literal["full", "structured"] = "full"
     
 class BugInfo(BaseModel):
     line: int
@@ -21,6 +24,7 @@ class LLMReviewResult(BaseModel):
     bugs_detected: List[BugInfo]
     suggestions: List[Suggestion]
     request_id: str
+    tier: Optional[str] = None
     
 class CodeReviewResponse(BaseModel):
     review: str
@@ -29,6 +33,20 @@ class CodeReviewResponse(BaseModel):
     request_id: str
     timestamp: str
 
+class BatchReviewRequest(BaseModel):
+    requests: List[CodeReviewRequest]
+    stream: bool = False
+
+class BatchReviewItem(BaseModel):
+    index: int
+    status: str
+    cached: bool = False
+    response: Optional[CodeReviewResponse] = None
+    error: Optional[str] = None
+
+class BatchReviewResponse(BaseModel):
+    results: List[BatchReviewItem]
+
 class RateLimitExceededError(Exception):
     pass
 
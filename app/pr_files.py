@@ -0,0 +1,80 @@
+import math
+import os
+from typing import Any, Dict, List, Optional
+
+VENDORED_DIRS = {"vendor", "vendors", "node_modules", "third_party", "third-party", "bower_components", ".yarn", "site-packages"}
+GENERATED_DIRS = {"dist", "build", "generated", "__generated__", "__snapshots__", "migrations_generated"}
+LOCKFILES = {
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "pipfile.lock", "cargo.lock",
+    "go.sum", "composer.lock", "gemfile.lock", "podfile.lock", "uv.lock", "packages.lock.json"
+}
+GENERATED_SUFFIXES = ("_pb2.py", "_pb2_grpc.py", ".pb.go", ".pb.cc", ".pb.h", ".g.dart", ".designer.cs", ".snap", ".map")
+MINIFIED_SUFFIXES = (".min.js", ".min.css", ".bundle.js")
+BINARY_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".webp", ".pdf", ".zip", ".gz", ".tgz", ".bz2", ".xz",
+    ".7z", ".jar", ".war", ".whl", ".exe", ".dll", ".so", ".dylib", ".a", ".o", ".class", ".pyc",
+    ".woff", ".woff2", ".ttf", ".otf", ".eot", ".mp3", ".mp4", ".mov", ".avi", ".wav", ".sqlite", ".db", ".bin"
+}
+
+SOURCE_EXTENSIONS = {
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".java", ".kt", ".go", ".rs", ".cpp", ".cc", ".c", ".h", ".hpp",
+    ".cs", ".php", ".rb", ".swift", ".scala", ".sql", ".sh"
+}
+CONFIG_EXTENSIONS = {".yml", ".yaml", ".toml", ".json", ".ini", ".cfg", ".tf", ".gradle"}
+DOC_EXTENSIONS = {".md", ".rst", ".txt", ".adoc"}
+SENSITIVE_MARKERS = ("auth", "security", "crypto", "password", "secret", "token", "permission", "payment", "billing", "migration")
+
+def exclusion_reason(file: Dict[str, Any], max_changes: int) -> Optional[str]:
+    path = file["filename"]
+    lowered = path.lower()
+    name = os.path.basename(lowered)
+    _, ext = os.path.splitext(name)
+    directories = set(lowered.split("/")[:-1])
+    
+    if file.get("status") == "removed":
+        return "removed"
+    if directories & VENDORED_DIRS:
+        return "vendored"
+    if name in LOCKFILES:
+        return "lockfile"
+    if name.endswith(MINIFIED_SUFFIXES):
+        return "minified"
+    if directories & GENERATED_DIRS or name.endswith(GENERATED_SUFFIXES):
+        return "generated"
+    if file.get("status") == "renamed" and file.get("changes") == 0:
+        return "renamed"
+    # GitHub omits the patch for binary files and reports no line changes.
+    if ext in BINARY_EXTENSIONS or (not file.get("patch") and file.get("changes") == 0):
+        return "binary"
+    if file.get("changes", 0) > max_changes:
+        return "too_large"
+    return None
+
+def risk_weight(path: str) -> float:
+    lowered = path.lower()
+    name = os.path.basename(lowered)
+    _, ext = os.path.splitext(name)
+    
+    if ext in SOURCE_EXTENSIONS:
+        weight = 1.0
+    elif ext in CONFIG_EXTENSIONS or name == "dockerfile" or lowered.startswith(".github/workflows/"):
+        weight = 0.7
+    elif ext in DOC_EXTENSIONS:
+        weight = 0.1
+    else:
+        weight = 0.4
+    
+    if "test" in lowered.split("/")[0] or name.startswith("test_") or "_test." in name or ".test." in name or ".spec." in name:
+        weight *= 0.5
+    if any(marker in lowered for marker in SENSITIVE_MARKERS):
+        weight *= 1.5
+    return weight
+
+def rank_files(files: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    # Bigger changes carry more risk, with diminishing returns so that one
+    # sweeping change does not outrank several meaningful ones.
+    return sorted(
+        files,
+        key=lambda file: risk_weight(file["filename"]) * math.log1p(file.get("changes", 0)),
+        reverse=True
+    )[:limit]
@@ -4,6 +4,11 @@ design patterns, and common bugs. Please review the following {language} code an
 
 Context: {context}
 
+Findings already reported earlier in this session:
+{history}
+
+Do not repeat findings listed above unless they are still present and important; focus on new or unresolved issues.
+
 Code to review:
 ```{language}
 {code}
@@ -42,6 +47,26 @@ Format your JSON response like this:
 Start with the general review followed by the JSON representation of your findings.
 """
 
+STRUCTURED_REVIEW_PROMPT = """
+You are an expert code reviewer. Review the following {language} code for bugs, security issues,
+performance problems and edge cases, and for concrete improvements.
+
+Context: {context}
+
+Findings already reported earlier in this session:
+{history}
+
+Do not repeat findings listed above unless they are still present and important.
+
+Code to review:
+```{language}
+{code}
+```
+
+Respond only with the findings. Use line numbers relative to the first line shown and keep
+descriptions short. Return empty lists if there is nothing to report.
+"""
+
 PULL_REQUEST_REVIEW_PROMPT = """
 You are an expert code reviewer with deep knowledge of software engineering best practices, 
 design patterns, and common bugs. Review the following pull request changes and provide feedback.
@@ -50,7 +75,8 @@ Repository: {repo}
 PR Title: {title}
 PR Description: {description}
 
-Changed Files:
+Changed Files (unified diff hunks with surrounding context, hunk headers give line numbers in the
+old and new file; small or unpatched files are shown in full):
 {files}
 
 Please provide a comprehensive review that:
@@ -64,3 +90,25 @@ Include specific file references and line numbers when discussing issues or sugg
 
 Your review should be helpful, constructive, and focused on improving the code quality.
 """
+
+INCREMENTAL_UNIT_CONTEXT = (
+    "This code is a single top-level unit extracted from a larger file. "
+    "Review it on its own and report line numbers relative to the first line shown."
+)
+
+CHUNK_CONTEXT = (
+    "This code is lines {start_line}-{end_line} of a {total_lines}-line file that is too large "
+    "to review in one pass; other parts are reviewed separately. The first {overlap} lines "
+    "repeat the end of the previous part for context only - do not report issues in them. "
+    "Report line numbers relative to the first line shown."
+)
+
+CHUNK_REDUCE_PROMPT = """
+You are an expert code reviewer. A large {language} file was reviewed in {chunk_count} parts.
+Below are the reviews of each part, in file order.
+
+{sections}
+
+Write one concise overall summary of the file's quality, the most important problems and
+the most valuable improvements. Do not repeat every finding and do not include a JSON block.
+"""
@@ -1,47 +1,272 @@
-import redis
+import math
 import time
+import uuid
 import logging
+from typing import Dict, NamedTuple, Optional, Tuple
+from .redis_pool import RedisPool
+from .metrics import RATE_LIMIT_DECISIONS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Both scripts read the clock from Redis so that replicas with skewed clocks
+# share one timeline. They grant as many of the requested tokens as are
+# available, but at least min_cost or nothing, and return
+# {granted, remaining, retry_after_ms, reset_ms}.
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local nonce = ARGV[4]
+local min_cost = tonumber(ARGV[5])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local count = redis.call('ZCARD', key)
+local granted = math.min(cost, limit - count)
+local retry_after = 0
+
+if granted >= min_cost then
+    for i = 1, granted do
+        redis.call('ZADD', key, now, nonce .. ':' .. i)
+    end
+    redis.call('PEXPIRE', key, window)
+    count = count + granted
+else
+    granted = 0
+    local needed = count + min_cost - limit
+    local blocking = redis.call('ZRANGE', key, needed - 1, needed - 1, 'WITHSCORES')
+    if blocking[2] then
+        retry_after = tonumber(blocking[2]) + window - now
+    else
+        retry_after = window
+    end
+end
+
+local reset = 0
+local newest = redis.call('ZRANGE', key, -1, -1, 'WITHSCORES')
+if newest[2] then
+    reset = tonumber(newest[2]) + window - now
+end
+
+return {granted, math.max(limit - count, 0), retry_after, reset}
+"""
+
+TOKEN_BUCKET_SCRIPT = """
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local refill_per_ms = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local min_cost = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local state = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local last = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - last, 0) * refill_per_ms)
+
+local granted = math.min(cost, math.floor(tokens))
+local retry_after = 0
+if granted >= min_cost then
+    tokens = tokens - granted
+else
+    granted = 0
+    retry_after = math.ceil((min_cost - tokens) / refill_per_ms)
+end
+
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', key, math.ceil(capacity / refill_per_ms))
+
+return {granted, math.floor(tokens), retry_after, math.ceil((capacity - tokens) / refill_per_ms)}
+"""
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float
+    reset_after: float
+    
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(time.time() + self.reset_after))
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(math.ceil(self.retry_after), 1))
+        return headers
+
+class LocalBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+    
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+    
+    def take(self, cost: int) -> Tuple[bool, int, float, float]:
+        self._refill()
+        allowed = self.tokens >= cost
+        retry_after = 0.0
+        if allowed:
+            self.tokens -= cost
+        else:
+            retry_after = (cost - self.tokens) / self.refill_per_second
+        reset_after = (self.capacity - self.tokens) / self.refill_per_second
+        return allowed, int(self.tokens), retry_after, reset_after
+
+class Lease:
+    __slots__ = ("tokens", "expires_at", "remaining", "reset_at")
+    
+    def __init__(self, tokens: int, expires_at: float, remaining: int, reset_at: float):
+        self.tokens = tokens
+        self.expires_at = expires_at
+        self.remaining = remaining
+        self.reset_at = reset_at
+
 class RateLimiter:
-    def __init__(self, redis_host: str, redis_port: int, rate_limit: int, window_minutes: int):
+    def __init__(
+        self,
+        redis_pool: RedisPool,
+        rate_limit: int,
+        window_minutes: int,
+        algorithm: str = "sliding_window",
+        burst: Optional[int] = None,
+        route_limits: Optional[Dict[str, int]] = None,
+        mode: str = "redis",
+        lease_fraction: float = 0.1,
+        lease_ttl: float = 5.0,
+        local_share: int = 1
+    ):
+        if algorithm not in ("sliding_window", "token_bucket"):
+            raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+        if mode not in ("redis", "hybrid"):
+            raise ValueError(f"Unknown rate limit mode: {mode}")
+        
         self.rate_limit = rate_limit
         self.window_seconds = window_minutes * 60
+        self.algorithm = algorithm
+        self.burst = burst
+        self.route_limits = route_limits or {}
+        self.mode = mode
+        self.lease_fraction = lease_fraction
+        self.lease_ttl = min(lease_ttl, self.window_seconds)
+        self.local_share = max(local_share, 1)
+        self.redis_pool = redis_pool
+        self.redis_client = redis_pool.client
+        self._sliding_window = self.redis_client.register_script(SLIDING_WINDOW_SCRIPT)
+        self._token_bucket = self.redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        self._leases: Dict[Tuple[str, str], Lease] = {}
+        self._local_buckets: Dict[Tuple[str, str], LocalBucket] = {}
+    
+    def limit_for(self, route: str) -> int:
+        return self.route_limits.get(route) or self.rate_limit
+    
+    def capacity_for(self, route: str) -> int:
+        limit = self.limit_for(route)
+        if self.algorithm == "token_bucket" and self.burst:
+            # The configured burst scales with the route's limit so that
+            # per-route overrides keep the same burst-to-rate ratio.
+            return max(limit, math.ceil(limit * self.burst / self.rate_limit))
+        return limit
+    
+    def lease_size_for(self, route: str) -> int:
+        # Tokens a worker may hold locally; at most this many per worker
+        # can sit unused, which bounds how far below the global limit a
+        # user can be held.
+        return max(1, int(self.capacity_for(route) * self.lease_fraction))
+    
+    def _take_lease(self, route: str, user_id: str, cost: int) -> Optional[RateLimitResult]:
+        lease = self._leases.get((route, user_id))
+        if lease is None:
+            return None
         
-        try:
-            self.redis_client = redis.Redis(
-                host=redis_host,
-                port=redis_port,
-                decode_responses=True
-            )
-            self.redis_client.ping()
-            logger.info("Successfully connected to Redis for rate limiting")
-        except redis.ConnectionError:
-            logger.warning("Could not connect to Redis - rate limiting will be disabled")
-            self.redis_client = None
-    
-    async def check_rate_limit(self, user_id: str) -> bool:
-        if not self.redis_client:
-            return True
+        now = time.monotonic()
+        if lease.expires_at <= now:
+            del self._leases[(route, user_id)]
+            return None
+        if lease.tokens < cost:
+            return None
+        
+        lease.tokens -= cost
+        RATE_LIMIT_DECISIONS.labels(source="lease").inc()
+        return RateLimitResult(
+            True,
+            self.capacity_for(route),
+            lease.remaining + lease.tokens,
+            0,
+            max(lease.reset_at - now, 0)
+        )
+    
+    def _store_lease(self, route: str, user_id: str, tokens: int, remaining: int, reset_after: float) -> None:
+        now = time.monotonic()
+        lease = self._leases.get((route, user_id))
+        if lease is not None and lease.expires_at > now:
+            tokens += lease.tokens
+        self._leases[(route, user_id)] = Lease(tokens, now + self.lease_ttl, remaining, now + reset_after)
+    
+    def _check_locally(self, route: str, user_id: str, cost: int) -> RateLimitResult:
+        # Without Redis each worker enforces its share of the limit on its
+        # own instead of failing open.
+        capacity = max(1, self.capacity_for(route) // self.local_share)
+        refill = self.limit_for(route) / self.local_share / self.window_seconds
+        
+        bucket = self._local_buckets.get((route, user_id))
+        if bucket is None:
+            if len(self._local_buckets) > 10000:
+                self._local_buckets = {k: b for k, b in self._local_buckets.items() if not b.idle}
+            bucket = self._local_buckets[(route, user_id)] = LocalBucket(capacity, refill)
+        
+        allowed, remaining, retry_after, reset_after = bucket.take(cost)
+        RATE_LIMIT_DECISIONS.labels(source="local_fallback").inc()
+        return RateLimitResult(allowed, capacity, remaining, retry_after, reset_after)
+    
+    async def check_rate_limit(self, user_id: str, route: str = "default", cost: int = 1) -> RateLimitResult:
+        if self.mode == "hybrid":
+            leased = self._take_lease(route, user_id, cost)
+            if leased is not None:
+                return leased
+        
+        if not self.redis_pool.available:
+            return self._check_locally(route, user_id, cost)
+        
+        limit = self.limit_for(route)
+        capacity = self.capacity_for(route)
+        window_ms = self.window_seconds * 1000
+        requested = max(cost, self.lease_size_for(route)) if self.mode == "hybrid" else cost
             
         try:
-            current_time = int(time.time())
-            key = f"ratelimit:{user_id}"
-            
-            self.redis_client.zremrangebyscore(key, 0, current_time - self.window_seconds)
-            
-            recent_requests = self.redis_client.zcard(key)
-            
-            if recent_requests < self.rate_limit:
-                pipeline = self.redis_client.pipeline()
-                pipeline.zadd(key, {str(current_time): current_time})
-                pipeline.expire(key, self.window_seconds)
-                pipeline.execute()
-                return True
-                
-            return False
+            if self.algorithm == "token_bucket":
+                granted, remaining, retry_ms, reset_ms = await self._token_bucket(
+                    keys=[f"ratelimit:tb:{route}:{user_id}"],
+                    args=[capacity, limit / window_ms, requested, cost]
+                )
+            else:
+                granted, remaining, retry_ms, reset_ms = await self._sliding_window(
+                    keys=[f"ratelimit:{route}:{user_id}"],
+                    args=[window_ms, limit, requested, uuid.uuid4().hex, cost]
+                )
         except Exception as e:
+            self.redis_pool.record_failure(e)
             logger.error(f"Error in rate limiting: {e}")
-            return True
+            return self._check_locally(route, user_id, cost)
+        
+        RATE_LIMIT_DECISIONS.labels(source="redis").inc()
+        if granted > cost:
+            self._store_lease(route, user_id, granted - cost, int(remaining), reset_ms / 1000)
+            remaining += granted - cost
+        
+        return RateLimitResult(granted > 0, capacity, int(remaining), retry_ms / 1000, reset_ms / 1000)
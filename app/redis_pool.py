@@ -0,0 +1,54 @@
+import time
+import logging
+from redis import asyncio as aioredis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialWithJitterBackoff
+from redis.exceptions import ConnectionError, TimeoutError
+from .config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class RedisPool:
+    def __init__(self):
+        self.pool = aioredis.ConnectionPool(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            password=settings.REDIS_PASSWORD or None,
+            decode_responses=False,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            retry=Retry(ExponentialWithJitterBackoff(cap=1.0, base=0.05), settings.REDIS_RETRY_ATTEMPTS),
+            retry_on_error=[ConnectionError, TimeoutError]
+        )
+        self.client = aioredis.Redis(connection_pool=self.pool)
+        self._retry_at = 0.0
+    
+    @property
+    def available(self) -> bool:
+        # After a connection failure callers skip Redis for a short backoff
+        # window; the first call after it expires probes the server again.
+        return time.monotonic() >= self._retry_at
+    
+    def record_failure(self, error: Exception) -> None:
+        if not isinstance(error, (ConnectionError, TimeoutError)):
+            return
+        if self.available:
+            logger.warning(f"Lost connection to Redis, retrying in {settings.REDIS_RECONNECT_BACKOFF}s: {error}")
+        self._retry_at = time.monotonic() + settings.REDIS_RECONNECT_BACKOFF
+    
+    async def ping(self) -> bool:
+        try:
+            await self.client.ping()
+            self._retry_at = 0.0
+            return True
+        except Exception as e:
+            self.record_failure(e)
+            logger.warning(f"Redis health check failed: {e}")
+            return False
+    
+    async def close(self) -> None:
+        await self.client.aclose()
+        await self.pool.disconnect()
@@ -0,0 +1,156 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Tuple, Type, TypeVar
+from .metrics import LLM_RETRIES, LLM_CIRCUIT_STATE, LLM_CIRCUIT_REJECTIONS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is temporarily unavailable")
+        self.retry_after = retry_after
+
+class DeadlineExceededError(Exception):
+    pass
+
+T = TypeVar("T")
+
+def remaining_time(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.monotonic()
+
+async def gather_bounded(calls: List[Callable[[], Awaitable[T]]], limit: Optional[int] = None) -> List[T]:
+    # Like asyncio.gather, but at most `limit` calls run at once and the
+    # first failure cancels the rest so none keep holding LLM capacity
+    # (asyncio.TaskGroup needs Python 3.11). Calls are factories so that
+    # ones cancelled before starting never create a coroutine.
+    semaphore = asyncio.Semaphore(limit) if limit else None
+    
+    async def run(call: Callable[[], Awaitable[T]]) -> T:
+        if semaphore is None:
+            return await call()
+        async with semaphore:
+            return await call()
+    
+    tasks = [asyncio.ensure_future(run(call)) for call in calls]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        LLM_CIRCUIT_STATE.labels(name=name).set(0)
+    
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"Circuit {self.name} changed from {self.state} to {state}")
+        self.state = state
+        LLM_CIRCUIT_STATE.labels(name=self.name).set(self.STATE_VALUES[state])
+    
+    def before_call(self) -> None:
+        if self.state == self.OPEN:
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.recovery_timeout:
+                LLM_CIRCUIT_REJECTIONS.labels(name=self.name).inc()
+                raise CircuitOpenError(self.name, self.recovery_timeout - elapsed)
+            self._set_state(self.HALF_OPEN)
+        
+        if self.state == self.HALF_OPEN:
+            # One probe at a time decides whether the circuit closes again.
+            if self._probe_in_flight:
+                LLM_CIRCUIT_REJECTIONS.labels(name=self.name).inc()
+                raise CircuitOpenError(self.name, 1.0)
+            self._probe_in_flight = True
+    
+    def record_success(self) -> None:
+        self._probe_in_flight = False
+        self.failures = 0
+        self._set_state(self.CLOSED)
+    
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+    
+    def release(self) -> None:
+        # For calls that ended in a caller error: says nothing about the
+        # dependency's health, but frees the half-open probe slot.
+        self._probe_in_flight = False
+
+class RetryPolicy:
+    def __init__(
+        self,
+        retryable: Tuple[Type[BaseException], ...],
+        max_attempts: int,
+        base_delay: float,
+        max_delay: float
+    ):
+        self.retryable = retryable
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    def backoff(self, attempt: int) -> float:
+        # Full jitter keeps retries from many requests from lining up.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+    
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        breaker: CircuitBreaker,
+        deadline: Optional[float] = None
+    ) -> Any:
+        attempt = 0
+        while True:
+            remaining = remaining_time(deadline)
+            if remaining is not None and remaining <= 0:
+                raise DeadlineExceededError("Review deadline exceeded before the model answered")
+            
+            breaker.before_call()
+            try:
+                result = await asyncio.wait_for(fn(), timeout=remaining)
+            except asyncio.TimeoutError:
+                breaker.record_failure()
+                raise DeadlineExceededError("Review deadline exceeded while waiting for the model")
+            except self.retryable as e:
+                breaker.record_failure()
+                attempt += 1
+                delay = self.backoff(attempt)
+                remaining = remaining_time(deadline)
+                if (
+                    attempt >= self.max_attempts
+                    or breaker.state == CircuitBreaker.OPEN
+                    or (remaining is not None and delay >= remaining)
+                ):
+                    raise
+                LLM_RETRIES.labels(error=type(e).__name__).inc()
+                logger.warning(f"Transient model error ({type(e).__name__}), retry {attempt} in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                breaker.release()
+                raise
+            
+            breaker.record_success()
+            return result
@@ -0,0 +1,21 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        task = self._calls.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+        
+        # The shared work runs in its own task so that the first caller
+        # disconnecting does not cancel it for everyone waiting on it.
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task), False
+    
+    def __len__(self) -> int:
+        return len(self._calls)
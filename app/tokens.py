@@ -0,0 +1,8 @@
+import math
+
+# Gemini tokenizes source code at roughly four characters per token; this is
+# only used for budgeting, so a cheap estimate beats a tokenizer round trip.
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
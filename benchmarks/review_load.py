@@ -0,0 +1,55 @@
+"""Offline load test for the review API against the fake LLM backend.
+
+Example:
+    FAKE_LLM_LATENCY_MS=1200 FAKE_LLM_ERROR_RATE=0.02 \
+        python -m benchmarks.review_load --requests 500 --concurrency 50
+"""
+import os
+import time
+import asyncio
+import argparse
+from collections import Counter
+
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+import httpx
+from app.main import app
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+async def run(total: int, concurrency: int, endpoint: str) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = Counter()
+    
+    # ASGITransport does not run the lifespan, which is what builds the services.
+    async with app.router.lifespan_context(app), \
+               httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120) as client:
+        async def one(index: int) -> None:
+            # Distinct code per request so every call reaches the backend.
+            payload = {"code": f"def f(x):\n    return {index} / x", "language": "Python"}
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(endpoint, json=payload, params={"user_id": f"bench-{index}"})
+                if endpoint.endswith("/stream"):
+                    await response.aread()
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] += 1
+        
+        started = time.perf_counter()
+        await asyncio.gather(*[one(index) for index in range(total)])
+        elapsed = time.perf_counter() - started
+    
+    print(f"{total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s), concurrency {concurrency}")
+    print(f"p50 {percentile(latencies, 0.5):.3f}s  p95 {percentile(latencies, 0.95):.3f}s  p99 {percentile(latencies, 0.99):.3f}s")
+    print("status codes:", dict(statuses))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--endpoint", default="/review")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency, args.endpoint))
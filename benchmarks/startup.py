@@ -0,0 +1,61 @@
+"""Import-time and startup benchmark for the API process.
+
+Each run uses a fresh interpreter so module caches do not hide import cost.
+Exits non-zero when the median exceeds a budget, for use in CI:
+    python -m benchmarks.startup --runs 5 --import-budget-ms 800 --startup-budget-ms 3000
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+CHILD = """
+import json, time, asyncio
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def start():
+    async with app.router.lifespan_context(app):
+        return time.perf_counter()
+
+ready = asyncio.run(start())
+print(json.dumps({"import": imported - started, "startup": ready - imported}))
+"""
+
+def measure(runs: int) -> dict:
+    env = {**os.environ, "LLM_BACKEND": os.environ.get("LLM_BACKEND", "fake")}
+    samples = {"import": [], "startup": []}
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        for phase, seconds in result.items():
+            samples[phase].append(seconds * 1000)
+    return {phase: statistics.median(values) for phase, values in samples.items()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float)
+    parser.add_argument("--startup-budget-ms", type=float)
+    args = parser.parse_args()
+    
+    medians = measure(args.runs)
+    print(f"import  {medians['import']:.0f} ms (median of {args.runs})")
+    print(f"startup {medians['startup']:.0f} ms (median of {args.runs})")
+    
+    over = [
+        phase for phase, budget in (("import", args.import_budget_ms), ("startup", args.startup_budget_ms))
+        if budget is not None and medians[phase] > budget
+    ]
+    if over:
+        print(f"Over budget: {', '.join(over)}")
+        sys.exit(1)
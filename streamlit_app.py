@@ -1,6 +1,8 @@
 import streamlit as st
 import requests
 import os
+import json
+import uuid
 from datetime import datetime
 
 st.set_page_config(
@@ -54,9 +56,24 @@ code {
 
 API_ENDPOINT = os.environ.get("API_ENDPOINT", "https://codesage-api.onrender.com")
 
+def iter_sse(response):
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
 if "history" not in st.session_state:
     st.session_state.history = []
 
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
 st.title("🔍 CodeSage - Intelligent Code Review & Bug Prediction")
 st.markdown("""
 This tool uses AI to analyze your code, find bugs, and suggest improvements.
@@ -112,6 +129,9 @@ with col2:
     context = st.text_input("Additional context (optional):", 
                             value="" if "context" not in st.session_state else st.session_state.context)
 
+incremental = st.checkbox("Incremental review (only re-review functions that changed since the last submission)")
+follow_up = st.checkbox("Follow up on earlier reviews in this session (skips cached reviews of identical code)")
+
 submit_button = st.button("Review My Code", type="primary", use_container_width=True)
 
 st.divider()
@@ -121,39 +141,56 @@ if submit_button:
     if not code.strip():
         st.error("Please enter some code to review")
     else:
-        with st.spinner("Analyzing your code..."):
-            try:
-                response = requests.post(
-                    f"{API_ENDPOINT}/review",
+        try:
+            result = None
+            stream_placeholder = st.empty()
+            
+            with st.spinner("Analyzing your code..."):
+                with requests.post(
+                    f"{API_ENDPOINT}/review/stream",
                     json={
                         "code": code,
                         "language": language,
-                        "context": context if context else None
+                        "context": context if context else None,
+                        "incremental": incremental,
+                        "session_id": st.session_state.session_id if follow_up else None
                     },
-                    timeout=60
-                )
+                    stream=True,
+                    timeout=(10, 120)
+                ) as response:
+                    if response.status_code != 200:
+                        st.error(f"Error: {response.status_code} - {response.text}")
+                    else:
+                        streamed_text = ""
+                        for event, data in iter_sse(response):
+                            if event == "chunk":
+                                streamed_text += data["text"]
+                                stream_placeholder.markdown(streamed_text)
+                            elif event == "result":
+                                result = data
+                            elif event == "error":
+                                st.error(f"Error: {data['detail']}")
+            
+            stream_placeholder.empty()
+            
+            if result:
+                st.session_state.last_review = result
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    st.session_state.last_review = result
-                    
-                    history_entry = {
-                        "code": code,
-                        "language": language,
-                        "context": context,
-                        "timestamp": datetime.now().isoformat(),
-                        "request_id": result["request_id"]
-                    }
-                    st.session_state.history.insert(0, history_entry)
-                    
-                    if len(st.session_state.history) > 10:
-                        st.session_state.history = st.session_state.history[:10]
-                    
-                    st.success("Review completed!")
-                else:
-                    st.error(f"Error: {response.status_code} - {response.text}")
-            except Exception as e:
-                st.error(f"Error: {e}")
+                history_entry = {
+                    "code": code,
+                    "language": language,
+                    "context": context,
+                    "timestamp": datetime.now().isoformat(),
+                    "request_id": result["request_id"]
+                }
+                st.session_state.history.insert(0, history_entry)
+                
+                if len(st.session_state.history) > 10:
+                    st.session_state.history = st.session_state.history[:10]
+                
+                st.success("Review completed!")
+        except Exception as e:
+            st.error(f"Error: {e}")
 
 if "last_review" in st.session_state:
     review = st.session_state.last_review
@@ -4,7 +4,7 @@ import uuid
 class MockLLMService:
     """Mock LLM service for testing."""
     
-    async def review_code(self, code, language, context=None):
+    async def review_code(self, code, language, context=None, history=None, deadline=None, mode="full"):
         """Return a mock review result."""
         
         if not code.strip():
@@ -45,4 +45,12 @@ class MockLLMService:
                 )
             ],
             request_id=str(uuid.uuid4())
-        )
\ No newline at end of file
+        )
+
+    async def review_code_stream(self, code, language, context=None, history=None, deadline=None):
+        """Yield the mock review in chunks, then the full result."""
+        
+        result = await self.review_code(code, language, context, history)
+        for start in range(0, len(result.review), 20):
+            yield result.review[start:start + 20]
+        yield result
@@ -1,21 +1,37 @@
+import pytest
+from unittest.mock import AsyncMock, patch
 from fastapi.testclient import TestClient
 from app.main import app
+from app.config import settings
 
-client = TestClient(app)
+@pytest.fixture
+def client():
+    # Entering the client runs the lifespan, which builds fresh services
+    # against the fake LLM backend.
+    with patch("app.main.redis_pool", None), \
+         patch("app.main.cache_manager", None), \
+         patch("app.main.rate_limiter", None), \
+         patch("app.main.llm_service", None), \
+         patch("app.main.github_service", None), \
+         patch.object(settings, "LLM_BACKEND", "fake"), \
+         patch.object(settings, "FAKE_LLM_LATENCY_MS", 10.0), \
+         patch.object(settings, "FAKE_LLM_TOKENS_PER_SECOND", 100000.0), \
+         TestClient(app) as client:
+        yield client
 
-def test_root_endpoint():
+def test_root_endpoint(client):
     """Test the API root endpoint."""
     response = client.get("/")
     assert response.status_code == 200
     assert response.json() == {"status": "online", "message": "CodeSage API is running"}
 
-def test_metrics_endpoint():
+def test_metrics_endpoint(client):
     """Test the metrics endpoint."""
     response = client.get("/metrics")
     assert response.status_code == 200
     assert "codesage" in response.text
 
-def test_review_validation():
+def test_review_validation(client):
     """Test review endpoint validation."""
     response = client.post(
         "/review",
@@ -27,4 +43,26 @@ def test_review_validation():
         "/review",
         json={"code": "print('hello')", "language": ""}
     )
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+
+def test_readiness_follows_lifespan():
+    """Test that /ready only succeeds once startup has completed."""
+    pool = AsyncMock()
+    pool.ping.return_value = False
+    
+    with patch("app.main.redis_pool", pool), \
+         patch("app.main.cache_manager", AsyncMock()), \
+         patch("app.main.rate_limiter", AsyncMock()), \
+         patch("app.main.llm_service", None), \
+         patch("app.main.github_service", None), \
+         patch.object(settings, "LLM_BACKEND", "fake"):
+        client = TestClient(app)
+        assert client.get("/ready").status_code == 503
+        
+        with TestClient(app) as live:
+            response = live.get("/ready")
+            assert response.status_code == 200
+            assert response.json()["checks"] == {"redis": "unavailable", "llm": "closed"}
+        
+        assert client.get("/ready").status_code == 503
@@ -0,0 +1,166 @@
+import json
+import time
+import asyncio
+import pytest
+import fakeredis
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.config import settings
+from app.cache_manager import CacheManager
+from app.models import CodeReviewResponse, FeedbackRequest
+from app.local_cache import LocalCache
+from app.fingerprint import review_fingerprint
+from app.cache_codec import CacheCodec, SERIALIZERS, COMPRESSIONS, LEGACY_JSON_PREFIXES
+
+def test_local_cache_evicts_least_recently_used():
+    """Test that the L1 cache evicts the least recently used entry when full."""
+    cache = LocalCache(max_entries=2, max_bytes=1024, ttl=60)
+    cache.set("a", 1, 10)
+    cache.set("b", 2, 10)
+    assert cache.get("a") == 1
+    
+    cache.set("c", 3, 10)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+def test_local_cache_respects_byte_limit_and_ttl():
+    """Test byte-size eviction and TTL expiry of the L1 cache."""
+    cache = LocalCache(max_entries=10, max_bytes=100, ttl=0.05)
+    cache.set("a", 1, 60)
+    cache.set("b", 2, 60)
+    assert cache.get("a") is None
+    assert cache.size_bytes == 60
+    
+    cache.set("too_big", 3, 101)
+    assert cache.get("too_big") is None
+    
+    time.sleep(0.06)
+    assert cache.get("b") is None
+    assert len(cache) == 0
+
+def test_fingerprint_ignores_whitespace_and_comments():
+    """Test that formatting-only edits map to the same cache fingerprint."""
+    original = "def add(a, b):\n    return a + b\n"
+    reformatted = "def add(a,b):  # sum\n  return a+b\r\n"
+    assert review_fingerprint(original, "Python") == review_fingerprint(reformatted, "python")
+    
+    js = "function add(a, b) {\n  return a + b;\n}"
+    js_commented = "function add(a, b) { // add two numbers\n    /* sum */ return a + b;  \n}\n"
+    assert review_fingerprint(js, "Javascript") == review_fingerprint(js_commented, "Javascript")
+
+def test_fingerprint_changes_when_lines_move():
+    """Test that edits shifting line numbers do not reuse cached line numbers."""
+    original = "def add(a, b):\n    return a + b\n"
+    assert review_fingerprint(original, "Python") != review_fingerprint("# helper\n\n\n" + original, "Python")
+    assert review_fingerprint(original, "Python") != review_fingerprint(original.replace(":\n", ":\n\n"), "Python")
+    
+    js = "function add(a, b) {\n  return a + b;\n}"
+    assert review_fingerprint(js, "Javascript") != review_fingerprint("/* add\n */\n" + js, "Javascript")
+    assert review_fingerprint(js, "Go") != review_fingerprint("\n" + js, "Go")
+
+def test_fingerprint_distinguishes_code_strings_and_context():
+    """Test that real changes, string contents and context change the fingerprint."""
+    assert review_fingerprint("x = a + b", "Python") != review_fingerprint("x = a - b", "Python")
+    assert review_fingerprint('s = "// a"', "Go") != review_fingerprint('s = "// b"', "Go")
+    assert review_fingerprint("x = 1", "Python", "hot path") != review_fingerprint("x = 1", "Python", "test helper")
+
+def test_cache_codec_round_trips_and_reads_legacy_json():
+    """Test that the cache codec compresses large entries and still reads plain JSON."""
+    codec = CacheCodec(serializer="msgpack", compression="zlib", threshold=128)
+    entry = {"review": "Looks good. " * 200, "bugs_detected": [], "source_digest": None}
+    
+    encoded = codec.encode(entry, keyspace="review")
+    assert len(encoded) < len(json.dumps(entry))
+    assert codec.decode(encoded) == entry
+    assert codec.decode(codec.encode({"a": 1})) == {"a": 1}
+    assert codec.decode(json.dumps(entry).encode()) == entry
+
+@pytest.mark.parametrize("serializer", ["msgpack", "json"])
+def test_cache_codec_round_trips_zstd(serializer):
+    """Test that zstd headers are not mistaken for legacy JSON."""
+    pytest.importorskip("zstandard")
+    codec = CacheCodec(serializer=serializer, compression="zstd", threshold=0)
+    entry = {"review": "Looks good. " * 200, "bugs_detected": []}
+    
+    assert codec.decode(codec.encode(entry)) == entry
+
+def test_cache_codec_headers_never_look_like_legacy_json():
+    """Test that no serializer/compression header byte starts a JSON value."""
+    for serializer in SERIALIZERS.values():
+        for compression in COMPRESSIONS.values():
+            assert (serializer << 4) | compression not in LEGACY_JSON_PREFIXES
+
+@pytest.mark.asyncio
+async def test_batch_lookup_treats_corrupt_entries_as_misses():
+    """Test that one unreadable Redis entry does not fail a batch lookup."""
+    redis_pool = MagicMock(available=True)
+    manager = CacheManager(redis_pool)
+    review = CodeReviewResponse(review="ok", bugs_detected=[], suggestions=[], request_id="r1", timestamp="now")
+    redis_pool.client.mget = AsyncMock(return_value=[
+        manager.codec.encode(review.model_dump()),
+        b"\x7fcorrupt",
+        None
+    ])
+    manager.redis_client = redis_pool.client
+    
+    found = await manager.get_cached_reviews([("good", None), ("bad", None), ("missing", None)])
+    
+    assert list(found) == ["good"]
+    assert found["good"].review == "ok"
+
+@pytest.mark.asyncio
+async def test_feedback_is_aggregated_acked_and_reclaimed_from_dead_consumers():
+    """Test the feedback stream end to end, including entries left by a dead consumer."""
+    redis_client = fakeredis.FakeAsyncRedis()
+    manager = CacheManager(MagicMock(available=True, client=redis_client))
+    review = CodeReviewResponse(review="ok", bugs_detected=[], suggestions=[], request_id="r1", timestamp="now")
+    await manager.cache_review("key", review, meta={"language": "python", "model": "m", "prompt_version": "v"})
+    
+    with patch.object(settings, "FEEDBACK_CLAIM_IDLE_SECONDS", 0.0):
+        await redis_client.xgroup_create(settings.FEEDBACK_STREAM, settings.FEEDBACK_CONSUMER_GROUP, id="0", mkstream=True)
+        await manager.store_feedback(FeedbackRequest(request_id="r1", helpful=True))
+        # A consumer that reads an entry and dies leaves it pending.
+        await redis_client.xreadgroup(settings.FEEDBACK_CONSUMER_GROUP, "dead", {settings.FEEDBACK_STREAM: ">"})
+        await manager.store_feedback(FeedbackRequest(request_id="r2", helpful=False))
+        
+        consumer = asyncio.create_task(manager.consume_feedback())
+        try:
+            for _ in range(100):
+                stats = await manager.get_feedback_stats(days=1)
+                if stats and stats["all"]["all"]["total"] == 2:
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            consumer.cancel()
+    
+    assert stats["all"]["all"] == {"total": 2, "helpful": 1}
+    assert stats["language"] == {"python": {"total": 1, "helpful": 1}, "unknown": {"total": 1, "helpful": 0}}
+    pending = await redis_client.xpending(settings.FEEDBACK_STREAM, settings.FEEDBACK_CONSUMER_GROUP)
+    assert pending["pending"] == 0
+
+@pytest.mark.asyncio
+async def test_invalidation_evicts_l1_on_other_replicas():
+    """Test that invalidating a review on one replica evicts it from another's L1 cache."""
+    server = fakeredis.FakeServer()
+    replicas = [CacheManager(MagicMock(available=True, client=fakeredis.FakeAsyncRedis(server=server))) for _ in range(2)]
+    review = CodeReviewResponse(review="ok", bugs_detected=[], suggestions=[], request_id="r1", timestamp="now")
+    
+    listener = asyncio.create_task(replicas[1].listen_for_invalidations())
+    try:
+        for _ in range(100):
+            if (await replicas[0].redis_client.pubsub_numsub(settings.CACHE_INVALIDATION_CHANNEL))[0][1]:
+                break
+            await asyncio.sleep(0.01)
+        for replica in replicas:
+            await replica.cache_review("key", review)
+        
+        await replicas[0].invalidate_review("key")
+        for _ in range(100):
+            if replicas[1].local_cache.get("key") is None:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        listener.cancel()
+    
+    assert replicas[1].local_cache.get("key") is None
+    assert await replicas[1].get_cached_review("key") is None
@@ -0,0 +1,250 @@
+import time
+import base64
+import asyncio
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from app.github_service import GitHubService
+from app.diff_context import needs_content, file_section
+from app.metrics import GITHUB_CONNECTIONS, GITHUB_CACHE_REQUESTS, GITHUB_RATE_LIMIT_REMAINING, PR_REVIEWS_SUPERSEDED
+
+@pytest_asyncio.fixture
+async def github_api():
+    async def pr_files(request):
+        return web.json_response([{"filename": "app.py"}])
+    
+    app = web.Application()
+    app.router.add_get("/repos/{owner}/{repo}/pulls/{number}/files", pr_files)
+    server = TestServer(app)
+    await server.start_server()
+    yield server
+    await server.close()
+
+def _connections(reused: str) -> float:
+    return GITHUB_CONNECTIONS.labels(endpoint="pr_files", reused=reused)._value.get()
+
+@pytest.mark.asyncio
+async def test_github_requests_share_one_pooled_session(github_api):
+    service = GitHubService()
+    service.api_base_url = str(github_api.make_url(""))
+    created, reused = _connections("false"), _connections("true")
+    
+    for _ in range(3):
+        assert await service.get_pr_files("octo/repo", 1) == [{"filename": "app.py"}]
+    
+    assert _connections("false") - created == 1
+    assert _connections("true") - reused == 2
+    await service.close()
+    assert service._session is None
+
+@pytest_asyncio.fixture
+async def pr_api():
+    comments = []
+    
+    async def pr_files(request):
+        return web.json_response([{"filename": f"src/module{i}.py"} for i in range(4)])
+    
+    async def contents(request):
+        await asyncio.sleep(0.1)
+        body = base64.b64encode(f"# {request.match_info['path']}".encode()).decode()
+        return web.json_response({"encoding": "base64", "content": body})
+    
+    async def comment(request):
+        comments.append((await request.json())["body"])
+        return web.json_response({}, status=201)
+    
+    app = web.Application()
+    app.router.add_get("/repos/{owner}/{repo}/pulls/{number}/files", pr_files)
+    app.router.add_get("/repos/{owner}/{repo}/contents/{path:.*}", contents)
+    app.router.add_post("/repos/{owner}/{repo}/issues/{number}/comments", comment)
+    server = TestServer(app)
+    await server.start_server()
+    server.comments = comments
+    yield server
+    await server.close()
+
+def _payload(sha: str) -> dict:
+    return {
+        "action": "synchronize",
+        "pull_request": {"number": 7, "title": "Change", "body": None, "head": {"sha": sha}},
+        "repository": {"full_name": "octo/repo"}
+    }
+
+@pytest.mark.asyncio
+async def test_pull_request_files_are_fetched_concurrently_and_superseded_reviews_cancelled(pr_api):
+    service = GitHubService()
+    service.api_base_url = str(pr_api.make_url(""))
+    llm_service = AsyncMock()
+    
+    async def generate(prompt, lane):
+        await asyncio.sleep(0.2)
+        return "looks good"
+    
+    llm_service.generate.side_effect = generate
+    superseded = PR_REVIEWS_SUPERSEDED._value.get()
+    
+    started = time.perf_counter()
+    first = asyncio.create_task(service.process_pull_request(_payload("old"), llm_service))
+    await asyncio.sleep(0.05)
+    await service.process_pull_request(_payload("new"), llm_service)
+    await first
+    
+    # Four 100ms fetches overlap instead of taking 400ms in sequence.
+    assert time.perf_counter() - started < 0.6
+    assert len(pr_api.comments) == 1
+    assert "src/module3.py" in llm_service.generate.await_args.args[0]
+    assert PR_REVIEWS_SUPERSEDED._value.get() - superseded == 1
+    
+    # Reviews cancelled by shutdown are not counted as superseded.
+    pending = asyncio.create_task(service.process_pull_request(_payload("newer"), llm_service))
+    await asyncio.sleep(0.05)
+    await service.close()
+    await pending
+    assert PR_REVIEWS_SUPERSEDED._value.get() - superseded == 1
+
+def test_pull_request_files_are_reviewed_from_hunks():
+    patch = "@@ -1,7 +1,7 @@\n a\n b\n c\n-d\n+D\n e\n f\n g"
+    changed = {"filename": "big.py", "status": "modified", "patch": patch}
+    
+    assert not needs_content(changed, 3)
+    assert needs_content(changed, 5)
+    assert needs_content({"filename": "huge.py", "status": "modified"}, 3)
+    
+    section = file_section(changed, None, 1, 200)
+    assert "@@ -3,3 +3,3 @@\n c\n-d\n+D\n e" in section
+    
+    content = "\n".join("abcDefghijklmnop")
+    widened = file_section(changed, content, 5, 10)
+    assert "@@ -1,9 +1,9 @@" in widened and " i" in widened
+    
+    whole = file_section(changed, content, 5, 50)
+    assert "@@ -1,16 +1,16 @@\n a\n b\n c\n-d\n+D\n e" in whole
+    assert whole.endswith(" p\n```\n")
+    
+    two_hunks = {"filename": "two.py", "status": "modified", "patch": patch + "\n@@ -12,3 +12,3 @@\n k\n-l\n+L\n m"}
+    assert file_section(two_hunks, content.replace("l", "L"), 3, 50).count("@@ -") == 1
+    assert file_section({"filename": "new.py"}, content, 3, 50) == f"\n--- new.py ---\n```py\n{content}\n```\n"
+
+@pytest_asyncio.fixture
+async def large_pr_api():
+    files = [
+        {"filename": f"docs/page{i}.md", "status": "modified", "changes": 4, "patch": "@@ -1 +1 @@\n-a\n+b"}
+        for i in range(230)
+    ] + [
+        {"filename": "node_modules/lib/index.js", "status": "modified", "changes": 40, "patch": "@@"},
+        {"filename": "package-lock.json", "status": "modified", "changes": 900, "patch": "@@"},
+        {"filename": "static/app.min.js", "status": "modified", "changes": 2, "patch": "@@"},
+        {"filename": "proto/api_pb2.py", "status": "modified", "changes": 300, "patch": "@@"},
+        {"filename": "assets/logo.png", "status": "added", "changes": 0},
+        {"filename": "src/schema.py", "status": "modified", "changes": 5000},
+        {"filename": "src/old.py", "status": "removed", "changes": 80},
+        {"filename": "src/utils.py", "status": "modified", "changes": 12, "patch": "@@"},
+        {"filename": "src/auth/session.py", "status": "modified", "changes": 30, "patch": "@@"},
+        {"filename": "tests/test_session.py", "status": "modified", "changes": 30, "patch": "@@"}
+    ]
+    
+    async def pr_files(request):
+        page = int(request.query.get("page", 1))
+        per_page = int(request.query["per_page"])
+        headers = {}
+        if page * per_page < len(files):
+            next_url = request.url.update_query(page=page + 1)
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return web.json_response(files[(page - 1) * per_page:page * per_page], headers=headers)
+    
+    app = web.Application()
+    app.router.add_get("/repos/{owner}/{repo}/pulls/{number}/files", pr_files)
+    server = TestServer(app)
+    await server.start_server()
+    yield server
+    await server.close()
+
+@pytest.mark.asyncio
+async def test_large_pull_requests_are_paginated_filtered_and_ranked(large_pr_api):
+    service = GitHubService()
+    service.api_base_url = str(large_pr_api.make_url(""))
+    
+    assert len(await service.get_pr_files("octo/repo", 1)) == 240
+    
+    selected = [file["filename"] for file in await service.select_pr_files("octo/repo", 1)]
+    assert selected[:3] == ["src/auth/session.py", "src/utils.py", "tests/test_session.py"]
+    assert len(selected) == 5
+    assert all(name.startswith("docs/") for name in selected[3:])
+    await service.close()
+
+class _MemoryRedis:
+    def __init__(self):
+        self.data = {}
+    
+    async def get(self, key):
+        return self.data.get(key)
+    
+    async def setex(self, key, ttl, value):
+        self.data[key] = value
+    
+    async def expire(self, key, ttl):
+        return key in self.data
+
+@pytest_asyncio.fixture
+async def etag_api():
+    statuses = []
+    
+    async def contents(request):
+        headers = {"ETag": '"v1"', "X-RateLimit-Remaining": str(4999 - len(statuses)), "X-RateLimit-Resource": "core"}
+        status = 304 if request.headers.get("If-None-Match") == '"v1"' else 200
+        statuses.append(status)
+        if status == 304:
+            return web.Response(status=304, headers=headers)
+        body = base64.b64encode(b"print('hi')").decode()
+        return web.json_response({"encoding": "base64", "content": body}, headers=headers)
+    
+    app = web.Application()
+    app.router.add_get("/repos/{owner}/{repo}/contents/{path:.*}", contents)
+    server = TestServer(app)
+    await server.start_server()
+    server.statuses = statuses
+    yield server
+    await server.close()
+
+@pytest.mark.asyncio
+async def test_github_responses_are_revalidated_with_etags(etag_api):
+    redis_pool = MagicMock(available=True, client=_MemoryRedis())
+    service = GitHubService(redis_pool)
+    service.api_base_url = str(etag_api.make_url(""))
+    hits = GITHUB_CACHE_REQUESTS.labels(endpoint="file_content", result="hit")._value.get()
+    
+    for _ in range(3):
+        assert await service.get_file_content("octo/repo", "app.py", "abc") == "print('hi')"
+    
+    assert etag_api.statuses == [200, 304, 304]
+    assert GITHUB_CACHE_REQUESTS.labels(endpoint="file_content", result="hit")._value.get() - hits == 2
+    assert GITHUB_RATE_LIMIT_REMAINING.labels(resource="core")._value.get() == 4997
+    await service.close()
+
+@pytest_asyncio.fixture
+async def mixed_content_api():
+    async def contents(request):
+        path = request.match_info["path"]
+        if path == "broken.json":
+            return web.Response(text="{not json", content_type="application/json")
+        raw = "café".encode("latin-1") if path == "legacy.py" else b"print('ok')"
+        return web.json_response({"encoding": "base64", "content": base64.b64encode(raw).decode()})
+    
+    app = web.Application()
+    app.router.add_get("/repos/{owner}/{repo}/contents/{path:.*}", contents)
+    server = TestServer(app)
+    await server.start_server()
+    yield server
+    await server.close()
+
+@pytest.mark.asyncio
+async def test_undecodable_files_do_not_fail_the_other_fetches(mixed_content_api):
+    service = GitHubService()
+    service.api_base_url = str(mixed_content_api.make_url(""))
+    
+    contents = await service.fetch_file_contents("octo/repo", ["legacy.py", "broken.json", "app.py"], "abc")
+    
+    assert contents == ["", "", "print('ok')"]
+    await service.close()
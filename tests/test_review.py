@@ -1,7 +1,24 @@
+import asyncio
+import json
+import time
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, AsyncMock
-from app.main import app
+from app.main import app, _review_meta, _prepare_review
+from app.llm_service import LLMService
+from app.rate_limiter import RateLimiter, RateLimitResult
+from app.redis_pool import RedisPool
+from app.single_flight import SingleFlight
+from app.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+from app.admission import AdmissionController, AdmissionRejectedError, INTERACTIVE, BULK
+from google.api_core import exceptions as google_exceptions
+from app.conversation import build_history_context, NO_HISTORY
+from app.code_units import split_chunks
+from app.llm_backends import LLMBackend, FakeBackend, FakeBackendError
+from app.model_routing import select_tier, LIGHT, STANDARD, STRONG
+from app.models import BugInfo, CodeReviewRequest
+from app.tokens import estimate_tokens
+from app.config import settings
 from tests.mock_llm_service import MockLLMService
 
 client = TestClient(app)
@@ -13,7 +30,7 @@ def mock_llm_service():
 @pytest.fixture
 def mock_rate_limiter():
     mock = AsyncMock()
-    mock.check_rate_limit.return_value = True
+    mock.check_rate_limit.return_value = RateLimitResult(True, 10, 9, 0, 60)
     return mock
 
 @pytest.fixture
@@ -27,6 +44,9 @@ def mock_cache_manager():
 @patch("app.main.cache_manager")
 def test_code_review_endpoint(mock_cm, mock_rl, mock_llm, mock_llm_service, mock_rate_limiter, mock_cache_manager):
     mock_cm.get_cached_review = mock_cache_manager.get_cached_review
+    mock_cm.cache_review = mock_cache_manager.cache_review
+    mock_cm.acquire_review_lock = mock_cache_manager.acquire_review_lock
+    mock_cm.release_review_lock = mock_cache_manager.release_review_lock
     mock_rl.check_rate_limit = mock_rate_limiter.check_rate_limit
     mock_llm.review_code = mock_llm_service.review_code
     
@@ -45,10 +65,11 @@ def test_code_review_endpoint(mock_cm, mock_rl, mock_llm, mock_llm_service, mock
     assert "suggestions" in data
     assert "request_id" in data
     assert "timestamp" in data
+    assert response.headers["X-RateLimit-Remaining"] == "9"
 
 @patch("app.main.rate_limiter")
 def test_rate_limiting(mock_rl, mock_rate_limiter):
-    mock_rate_limiter.check_rate_limit.return_value = False
+    mock_rate_limiter.check_rate_limit.return_value = RateLimitResult(False, 10, 0, 12.5, 60)
     mock_rl.check_rate_limit = mock_rate_limiter.check_rate_limit
     
     response = client.post(
@@ -59,4 +80,431 @@ def test_rate_limiting(mock_rl, mock_rate_limiter):
         }
     )
     
-    assert response.status_code == 429
\ No newline at end of file
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "13"
+    assert response.headers["X-RateLimit-Remaining"] == "0"
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = 0
+    
+    async def slow_review():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "review"
+    
+    results = await asyncio.gather(*[flight.do("same-key", slow_review) for _ in range(5)])
+    
+    assert calls == 1
+    assert [value for value, _ in results] == ["review"] * 5
+    assert sum(1 for _, coalesced in results if coalesced) == 4
+    assert len(flight) == 0
+
+@pytest.mark.asyncio
+async def test_incremental_review_only_reviews_changed_units():
+    service = LLMService()
+    mock_service = MockLLMService()
+    reviewed = []
+    
+    async def review_unit(code, language, context=None, deadline=None, mode="full"):
+        reviewed.append(code)
+        return await mock_service.review_code(code, language, context)
+    
+    service.review_code = review_unit
+    store = {}
+    unit_cache = AsyncMock()
+    unit_cache.get_unit_reviews.side_effect = lambda keys: {k: store[k] for k in keys if k in store}
+    unit_cache.cache_unit_reviews.side_effect = store.update
+    
+    original = "def first(x):\n    return 1 / x\n\n\ndef second(y):\n    return y\n"
+    result = await service.review_code_incremental(original, "Python", None, unit_cache)
+    assert len(reviewed) == 2
+    assert [bug.line for bug in result.bugs_detected] == [1, 5]
+    
+    reviewed.clear()
+    edited = original.replace("return y", "return y * 2")
+    result = await service.review_code_incremental(edited, "Python", None, unit_cache)
+    assert reviewed == ["def second(y):\n    return y * 2"]
+    assert [bug.line for bug in result.bugs_detected] == [1, 5]
+
+@pytest.mark.asyncio
+async def test_incremental_review_bounds_fan_out_and_cancels_on_failure():
+    service = LLMService()
+    service.backend = FakeBackend(latency_ms=1, latency_sigma=0.1, tokens_per_second=1e6, output_tokens=50, error_rate=0)
+    unit_cache = AsyncMock()
+    unit_cache.get_unit_reviews.return_value = {}
+    code = "\n\n".join(f"def f{i}(x):\n    return x + {i}" for i in range(150))
+    
+    # More units than the admission queue holds still complete.
+    result = await service.review_code_incremental(code, "Python", None, unit_cache)
+    assert len(unit_cache.cache_unit_reviews.await_args.args[0]) == 150
+    assert result.request_id
+    
+    running = []
+    
+    async def review_unit(code, language, context=None, deadline=None, mode="full"):
+        running.append(code)
+        try:
+            if code.startswith("def f0("):
+                raise RuntimeError("model failed")
+            await asyncio.sleep(10)
+        finally:
+            running.remove(code)
+    
+    service.review_code = review_unit
+    with pytest.raises(RuntimeError):
+        await service.review_code_incremental(code, "Python", None, unit_cache)
+    assert running == []
+    assert service.admission.active == 0 and service.admission.queued() == 0
+
+@pytest.mark.asyncio
+async def test_rate_limiter_enforces_locally_without_redis():
+    redis_pool = RedisPool()
+    redis_pool._retry_at = float("inf")
+    limiter = RateLimiter(redis_pool, rate_limit=3, window_minutes=1, mode="hybrid")
+    
+    results = [await limiter.check_rate_limit("user", "review") for _ in range(4)]
+    
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert results[-1].retry_after > 0
+
+def test_history_context_stays_within_token_budget():
+    turns = [
+        {
+            "request_id": f"{i:08d}-turn",
+            "language": "Python",
+            "bugs": [{"line": n, "severity": "high", "description": "Unchecked division by zero " * 3} for n in range(5)],
+            "suggestions": ["Add type hints"]
+        }
+        for i in range(30)
+    ]
+    
+    context = build_history_context(turns, budget_tokens=400)
+    
+    assert estimate_tokens(context) <= 420
+    assert "Review 00000000 (Python)" in context and "Line 0 [high]" in context
+    assert "older reviews omitted" in context
+    assert build_history_context([], budget_tokens=400) == NO_HISTORY
+
+@pytest.mark.asyncio
+async def test_history_is_only_keyed_where_the_prompt_uses_it():
+    turn = {"request_id": "00000000-turn", "language": "Python", "bugs": [], "suggestions": ["Add type hints"]}
+    code = "def f(x):\n    return 1 / x"
+    
+    with patch("app.main.cache_manager") as mock_cm:
+        mock_cm.get_conversation_history = AsyncMock(return_value=[turn])
+        plain_key, _, _ = await _prepare_review(CodeReviewRequest(code=code, language="Python"))
+        session_key, _, history = await _prepare_review(CodeReviewRequest(code=code, language="Python", session_id="s"))
+        assert history and session_key != plain_key
+        
+        incremental = CodeReviewRequest(code=code, language="Python", incremental=True)
+        incremental_session = incremental.model_copy(update={"session_id": "s"})
+        assert (await _prepare_review(incremental))[0] == (await _prepare_review(incremental_session))[0]
+
+@patch("app.main.cache_manager")
+def test_cache_purge_endpoint_requires_admin_token(mock_cm):
+    mock_cm.invalidate_review = AsyncMock(return_value=True)
+    mock_cm.get_conversation_history = AsyncMock(return_value=[])
+    payload = {"code": "print('hello')", "language": "Python"}
+    
+    with patch.object(settings, "CACHE_ADMIN_TOKEN", "secret"):
+        assert client.post("/cache/purge", json=payload).status_code == 403
+        assert client.post("/cache/purge", json=payload, headers={"X-Admin-Token": "wrong"}).status_code == 403
+        response = client.post("/cache/purge", json=payload, headers={"X-Admin-Token": "secret"})
+    
+    assert response.status_code == 200
+    mock_cm.invalidate_review.assert_awaited_once_with(response.json()["key"])
+
+@patch("app.main.cache_manager")
+def test_feedback_stats_endpoint(mock_cm):
+    mock_cm.get_feedback_stats = AsyncMock(return_value={
+        "all": {"all": {"total": 4, "helpful": 3}},
+        "language": {"python": {"total": 4, "helpful": 3}}
+    })
+    
+    response = client.get("/feedback/stats?days=3")
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["helpful_rate"] == 0.75
+    assert data["by_language"]["python"]["total"] == 4
+    assert data["by_model"] == {}
+    mock_cm.get_feedback_stats.assert_awaited_once_with(3)
+
+@patch("app.main.llm_service")
+@patch("app.main.rate_limiter")
+@patch("app.main.cache_manager")
+def test_streaming_review_endpoint(mock_cm, mock_rl, mock_llm, mock_llm_service, mock_rate_limiter, mock_cache_manager):
+    mock_cm.get_cached_review = mock_cache_manager.get_cached_review
+    mock_cm.cache_review = mock_cache_manager.cache_review
+    mock_rl.check_rate_limit = mock_rate_limiter.check_rate_limit
+    mock_llm.review_code_stream = mock_llm_service.review_code_stream
+    
+    response = client.post(
+        "/review/stream",
+        json={
+            "code": "def add(a, b):\n    return a + b",
+            "language": "Python"
+        }
+    )
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in response.text.strip().split("\n\n")
+    ]
+    chunks = "".join(data["text"] for event, data in events if event == "chunk")
+    assert events[-1][0] == "result"
+    assert events[-1][1]["review"] == chunks
+    assert len(events[-1][1]["bugs_detected"]) == 1
+
+@patch("app.main.llm_service")
+@patch("app.main.rate_limiter")
+@patch("app.main.cache_manager")
+def test_batch_review_endpoint(mock_cm, mock_rl, mock_llm, mock_llm_service, mock_rate_limiter, mock_cache_manager):
+    mock_cm.get_cached_reviews = AsyncMock(return_value={})
+    mock_cm.cache_review = mock_cache_manager.cache_review
+    mock_cm.acquire_review_lock = mock_cache_manager.acquire_review_lock
+    mock_cm.release_review_lock = mock_cache_manager.release_review_lock
+    mock_rl.check_rate_limit = mock_rate_limiter.check_rate_limit
+    
+    async def review_or_fail(code, language, context=None, history=None, deadline=None, mode="full"):
+        if "boom" in code:
+            raise ValueError("model rejected the prompt")
+        return await mock_llm_service.review_code(code, language, context, history)
+    
+    mock_llm.review_code = AsyncMock(side_effect=review_or_fail)
+    
+    snippet = {"code": "def add(a, b):\n    return a + b", "language": "Python"}
+    response = client.post(
+        "/review/batch",
+        json={"requests": [snippet, {"code": "boom()", "language": "Python"}, snippet]}
+    )
+    
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [item["index"] for item in results] == [0, 1, 2]
+    assert [item["status"] for item in results] == ["ok", "error", "ok"]
+    assert results[0]["response"]["request_id"] == results[2]["response"]["request_id"]
+    assert "model rejected the prompt" in results[1]["error"]
+    assert mock_llm.review_code.await_count == 2
+    mock_rate_limiter.check_rate_limit.assert_awaited_once_with("anonymous", "review", 2)
+
+@pytest.mark.asyncio
+async def test_retry_policy_retries_transient_errors_and_trips_breaker():
+    policy = RetryPolicy((google_exceptions.ServiceUnavailable,), max_attempts=3, base_delay=0.001, max_delay=0.001)
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=60)
+    calls = 0
+    
+    async def flaky():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise google_exceptions.ServiceUnavailable("overloaded")
+        return "ok"
+    
+    assert await policy.call(flaky, breaker) == "ok"
+    assert calls == 2
+    assert breaker.state == CircuitBreaker.CLOSED
+    
+    async def rejected():
+        raise google_exceptions.InvalidArgument("bad prompt")
+    
+    with pytest.raises(google_exceptions.InvalidArgument):
+        await policy.call(rejected, breaker)
+    assert breaker.failures == 0
+    
+    async def down():
+        raise google_exceptions.ServiceUnavailable("down")
+    
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        await policy.call(down, breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    
+    with pytest.raises(CircuitOpenError):
+        await policy.call(flaky, breaker)
+
+@patch("app.main.llm_service")
+@patch("app.main.rate_limiter")
+@patch("app.main.cache_manager")
+def test_open_circuit_returns_503(mock_cm, mock_rl, mock_llm, mock_rate_limiter, mock_cache_manager):
+    mock_cm.get_cached_review = mock_cache_manager.get_cached_review
+    mock_cm.acquire_review_lock = mock_cache_manager.acquire_review_lock
+    mock_cm.release_review_lock = mock_cache_manager.release_review_lock
+    mock_rl.check_rate_limit = mock_rate_limiter.check_rate_limit
+    mock_llm.review_code = AsyncMock(side_effect=CircuitOpenError("gemini", 12.2))
+    
+    response = client.post("/review", json={"code": "print('hi')", "language": "Python"})
+    
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "13"
+
+@pytest.mark.asyncio
+async def test_admission_controller_bounds_concurrency_and_sheds_load():
+    controller = AdmissionController(max_concurrency=2, max_queue=1, weights={"interactive": 1})
+    running = 0
+    peak = 0
+    
+    async def call():
+        nonlocal running, peak
+        async with controller.slot():
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.05)
+            running -= 1
+    
+    results = await asyncio.gather(*[call() for _ in range(4)], return_exceptions=True)
+    
+    assert peak == 2
+    rejected = [r for r in results if isinstance(r, AdmissionRejectedError)]
+    assert len(rejected) == 1 and rejected[0].reason == "queue_full"
+    assert controller.active == 0
+    
+    # With a measured service time, a deadline shorter than the expected
+    # wait is rejected up front instead of queueing.
+    blocker = asyncio.create_task(call())
+    other = asyncio.create_task(call())
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejectedError) as error:
+        async with controller.slot(deadline=time.monotonic() + 0.001):
+            pass
+    assert error.value.reason == "deadline"
+    await asyncio.gather(blocker, other)
+
+@pytest.mark.asyncio
+async def test_admission_lanes_reserve_capacity_and_favour_interactive():
+    controller = AdmissionController(
+        max_concurrency=2,
+        max_queue=10,
+        weights={INTERACTIVE: 3, BULK: 1},
+        reserved={INTERACTIVE: 1}
+    )
+    order = []
+    
+    async def call(lane, name, duration=0.01):
+        async with controller.slot(lane):
+            order.append(name)
+            await asyncio.sleep(duration)
+    
+    bulk = [asyncio.create_task(call(BULK, f"b{i}")) for i in range(4)]
+    await asyncio.sleep(0)
+    assert controller.lane_active[BULK] == 1
+    
+    # The reserved slot lets an interactive call start despite the bulk backlog.
+    interactive = asyncio.create_task(call(INTERACTIVE, "i0", duration=0.03))
+    await asyncio.sleep(0)
+    assert order == ["b0", "i0"]
+    
+    more = [asyncio.create_task(call(INTERACTIVE, f"i{i}")) for i in range(1, 4)]
+    await asyncio.gather(interactive, *bulk, *more)
+    
+    assert order.index("i3") < order.index("b3")
+    assert controller.active == 0
+
+@pytest.mark.asyncio
+async def test_oversized_review_is_chunked_and_merged():
+    code = "\n\n".join(f"def f{i}(x):\n    return x + {i}" for i in range(12))
+    chunks = split_chunks(code, "Python", max_tokens=40, overlap_lines=2)
+    
+    assert len(chunks) > 1
+    assert chunks[0].overlap == 0 and all(chunk.overlap == 2 for chunk in chunks[1:])
+    assert [chunk.start_line + chunk.overlap for chunk in chunks][1:] == [chunk.end_line + 1 for chunk in chunks][:-1]
+    assert chunks[-1].end_line == len(code.splitlines())
+    
+    service = LLMService()
+    mock_service = MockLLMService()
+    
+    async def review_chunk(code, language, context=None, history=None, deadline=None, mode="full", tier="standard"):
+        result = await mock_service.review_code(code, language, context)
+        # Every chunk flags its first line, which is overlap for all but the first.
+        return result.model_copy(update={"bugs_detected": [BugInfo(line=1, description="x", severity="low")]})
+    
+    service._review_single = review_chunk
+    with patch("app.llm_service.settings") as settings:
+        settings.REVIEW_CHUNK_TOKENS = 40
+        settings.REVIEW_CHUNK_OVERLAP_LINES = 2
+        settings.REVIEW_CHUNK_REDUCE = False
+        settings.REVIEW_FANOUT_CONCURRENCY = 4
+        result = await service.review_code(code, "Python")
+        
+        assert [bug.line for bug in result.bugs_detected] == [1]
+        assert result.review.count("### Lines") == len(chunks)
+        
+        # One failing chunk cancels the others rather than leaving them running.
+        running = []
+        
+        async def failing_chunk(code, language, context=None, history=None, deadline=None, mode="full", tier="standard"):
+            running.append(code)
+            try:
+                if "def f0(" in code:
+                    raise RuntimeError("model failed")
+                await asyncio.sleep(10)
+            finally:
+                running.remove(code)
+        
+        service._review_single = failing_chunk
+        with pytest.raises(RuntimeError):
+            await service.review_code(code, "Python")
+        assert running == []
+
+@pytest.mark.asyncio
+async def test_structured_mode_requests_schema_output():
+    service = LLMService()
+    payload = {
+        "bugs": [{"line": 2, "description": "Division by zero", "severity": "high", "suggestion": None}],
+        "suggestions": [{"description": "Validate the divisor"}]
+    }
+    service.generate = AsyncMock(return_value=json.dumps(payload))
+    
+    result = await service.review_code("def f(x):\n    return 1 / x", "Python", mode="structured")
+    
+    assert result.review == ""
+    assert [(bug.line, bug.severity) for bug in result.bugs_detected] == [(2, "high")]
+    assert result.suggestions[0].description == "Validate the divisor"
+    assert service.generate.await_args.kwargs["schema"]["required"] == ["bugs", "suggestions"]
+
+@pytest.mark.asyncio
+async def test_fake_backend_simulates_reviews_and_failures():
+    backend = FakeBackend(latency_ms=1, latency_sigma=0.1, tokens_per_second=1e6, output_tokens=200, error_rate=0, seed=1)
+    service = LLMService()
+    
+    chunks = [text async for text in await backend.stream("prompt")]
+    bugs_detected, suggestions = service._parse_review("".join(chunks))
+    assert len(chunks) > 1
+    assert bugs_detected[0].severity == "medium" and suggestions
+    assert json.loads(await backend.generate("prompt", schema={}))["bugs"]
+    
+    failing = FakeBackend(latency_ms=1, latency_sigma=0.1, tokens_per_second=1e6, output_tokens=200, error_rate=1)
+    with pytest.raises(FakeBackendError):
+        await failing.generate("prompt")
+    
+    class IncompleteBackend(LLMBackend):
+        async def generate(self, prompt, schema=None, model=None):
+            return ""
+    
+    with pytest.raises(TypeError):
+        IncompleteBackend()
+
+@pytest.mark.asyncio
+async def test_model_routing_and_escalation():
+    snippet = "def f(x):\n    return 1 / x"
+    assert select_tier(snippet, "Python") == LIGHT
+    assert select_tier(snippet, "COBOL") == STANDARD
+    assert select_tier(snippet * 2000, "Python") == STRONG
+    
+    service = LLMService()
+    payload = {"bugs": [{"line": 2, "description": "Division by zero", "severity": "high"}], "suggestions": []}
+    service.generate = AsyncMock(side_effect=["not json", json.dumps(payload)])
+    
+    result = await service.review_code(snippet, "Python", mode="structured")
+    
+    assert [call.kwargs["tier"] for call in service.generate.await_args_list] == [LIGHT, STANDARD]
+    assert result.bugs_detected[0].line == 2
+    assert result.tier == STANDARD
+    
+    request = CodeReviewRequest(code=snippet, language="Python", mode="structured")
+    meta = _review_meta(request, result)
+    assert (meta["tier"], meta["model"]) == (STANDARD, settings.GEMINI_MODEL)